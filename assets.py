@@ -0,0 +1,53 @@
+import time
+
+# Taken before anything else is imported (pygame's import is one of the slowest parts of starting up), so importing
+# this first thing gives the time from launch to the first usable frame
+LAUNCHED = time.perf_counter()
+
+import os
+import threading
+
+import pygame
+
+
+class AssetManager:
+    """Starts pygame once and loads every font (and size) once, the first time it's needed or in the background."""
+
+    def __init__(self):
+        self.initialised = False
+        self.fonts = {}
+        self.lock = threading.Lock()
+        self.startup_ms = None
+
+    def init(self):
+        if not self.initialised:
+            pygame.init()
+            pygame.font.init()
+            self.initialised = True
+
+    def font(self, name, size):
+        # Loaded while holding the lock, as SDL_ttf can't open two fonts at once from different threads
+        with self.lock:
+            font = self.fonts.get((name, size))
+            if font is None:
+                self.init()
+                font = self.fonts[(name, size)] = pygame.font.Font(name, size)
+            return font
+
+    def preload(self, fonts):
+        """Loads (name, size) fonts on a background thread, in order, so they're ready by the time they're asked for.
+        Asking for one of them before then waits for the ones before it."""
+        self.init()
+        thread = threading.Thread(target=lambda: [self.font(name, size) for name, size in fonts], daemon=True)
+        thread.start()
+        return thread
+
+    def mark_interactive(self):
+        """Called once the first frame that can be interacted with is on screen, to record how long startup took."""
+        if self.startup_ms is None:
+            self.startup_ms = (time.perf_counter() - LAUNCHED) * 1000
+            if os.environ.get("PAPERIO_STARTUP_TIME"):
+                print(f"Startup took {self.startup_ms:.0f} ms")
+
+
+manager = AssetManager()
@@ -0,0 +1,372 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# No window is needed to measure anything, so use SDL's dummy video driver unless told otherwise.
+# pygame's hello message is hidden so the results are the only thing on stdout.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+import capture
+import envs
+import game
+import snakefile
+import territory
+import world
+
+# Runs scripted matches with no input and reports how long each phase of the game takes.
+#   python benchmark.py                              every scenario with the default sizes
+#   python benchmark.py ticks big_capture --size 100 --players 20 --output results.json
+#   python benchmark.py bots --size 400 --players 150 --ticks 300     a load test with 150 bots
+
+
+class Timings:
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def time(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def add(self, phase, seconds):
+        self.phases.setdefault(phase, []).append(seconds)
+
+    def wrap(self, phase, function):
+        def timed(*args, **kwargs):
+            with self.time(phase):
+                return function(*args, **kwargs)
+        return timed
+
+    def summary(self):
+        summary = {}
+        for phase, samples in self.phases.items():
+            ms = np.array(samples) * 1000
+            summary[phase] = {
+                "count": len(ms),
+                "mean_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+            }
+        return summary
+
+
+class ScriptedPolicy:
+    """Plays every player by drawing random rectangles out of its own area, which is how most real loops look."""
+
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.plans = {}
+
+    def __call__(self, match):
+        inputs = {}
+        for player_id in match.players:
+            plan = self.plans.get(player_id)
+            if not plan:
+                out = self.random.choice(list(world.DIRECTIONS))
+                side = self.random.choice([d for d in world.DIRECTIONS if d not in (out, world.OPPOSITES[out])])
+                length, width = self.random.randint(2, 10), self.random.randint(2, 10)
+                plan = [out] * length + [side] * width + [world.OPPOSITES[out]] * (length + 1) + [world.OPPOSITES[side]] * 2
+                self.plans[player_id] = plan
+            inputs[player_id] = plan.pop(0)
+        return inputs
+
+
+def make_game(size, players, grid_size):
+    screen = pygame.display.set_mode((size * grid_size, size * grid_size))
+    match = game.Game(screen, grid_size)
+
+    # Game only knows about three players, make up the rest
+    colours = random.Random(0)
+    while len(match.players) < players:
+        colour = pygame.Color(colours.randint(0, 255), colours.randint(0, 255), colours.randint(0, 255))
+        match.players.append({"display": f"P{len(match.players) + 1}", "colour": colour, "controls": [0, 0, 0, 0]})
+        match.set_player_colour(len(match.players), colour)
+        snakefile.Snake(match, match.world.join(len(match.players)), colour, match.snakes)
+    return match
+
+
+def scenario_ticks(args, timings):
+    """N snakes playing on an MxM board, timing the tick, capture, death, sync and render phases."""
+    match = make_game(args.size, args.players, args.grid_size)
+    match.world.capture_engine = timings.wrap("capture", match.world.capture_engine)
+    match.world.clear_dead = timings.wrap("death", match.world.clear_dead)
+    policy = ScriptedPolicy(args.seed)
+
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        inputs = policy(match.world)
+        with timings.time("tick"):
+            match.world.step(inputs)
+        with timings.time("sync"):
+            match.sync_snakes()
+        with timings.time("render"):
+            match.render()
+    return {"ticks_per_second": args.ticks / (time.perf_counter() - start)}
+
+
+def weave(size, top, bottom):
+    # Right and left across the board, dropping two rows at each side, between rows top and bottom
+    route = []
+    for row in range(top, bottom - 2, 2):
+        route += ["left" if (row - top) % 4 else "right"] * (size - 3) + ["down"] * 2
+    return route
+
+
+def scenario_long_trails(args, timings):
+    """Snakes weaving across the board without ever going home, so trails get as long as the board allows."""
+    match = world.World(args.size, args.size, seed=args.seed)
+    lanes = max(1, min(args.players, args.size // 4))
+    lane_height = args.size // lanes
+    routes = {}
+    for player_id in range(1, lanes + 1):
+        top = (player_id - 1) * lane_height + 1
+        match.spawn(player_id, (1, top))
+        routes[player_id] = weave(args.size, top, top + lane_height - 1)
+
+    for tick in range(args.ticks):
+        inputs = {player_id: route[tick] for player_id, route in routes.items() if tick < len(route)}
+        with timings.time("tick"):
+            match.step(inputs)
+
+    return {"longest_trail": max((len(player.body) for player in match.players.values()), default=0)}
+
+
+def loop_trail(size, margin):
+    # A trail that leaves the top left corner and goes all the way round the board, just inside its edge
+    low, high = margin, size - 1 - margin
+    trail = [(x, low) for x in range(low + 1, high + 1)]
+    trail += [(high, y) for y in range(low + 1, high + 1)]
+    trail += [(x, high) for x in range(high - 1, low - 1, -1)]
+    trail += [(low, y) for y in range(high - 1, low + 1, -1)]
+    return trail[::-1]
+
+
+def scenario_big_capture(args, timings):
+    """A player closing a loop round the whole board, timed for each capture engine and the polygon helpers."""
+    trail = loop_trail(args.size, 1)
+    head = (1, 1)
+    for _ in range(args.repeat):
+        for engine in capture.ENGINES:
+            board = territory.Territory(args.size, args.size)
+            board.fill_rect(0, 0, 3, 3, 1)
+            with timings.time(f"capture_{engine}"):
+                capture.ENGINES[engine](board, 1, list(trail), head)
+
+        owned = [(x, y) for x in range(3) for y in range(3)]
+        with timings.time("bfs_shortest_path"):
+            path = capture.bfs_shortest_path(owned, head, trail[-1])
+        with timings.time("points_within_polygon"):
+            capture.points_within_polygon(path + trail[::-1])
+
+    return {"trail_length": len(trail)}
+
+
+def scenario_mass_deaths(args, timings):
+    """Every player owning a big block of the board dying in the same tick."""
+    match = make_game(args.size, args.players, args.grid_size)
+    columns = int(np.ceil(np.sqrt(args.players)))
+    block = max(1, args.size // columns)
+
+    freed = 0
+    for _ in range(args.repeat):
+        for i, player in enumerate(match.players):
+            match.world.territory.fill_rect((i % columns) * block, (i // columns) * block, block, block, i + 1)
+        match.render()
+
+        match.world.events = []
+        for player in list(match.world.players.values()):
+            match.world.kill(player)
+        with timings.time("death"):
+            match.world.clear_dead()
+        match.sync_snakes()
+        with timings.time("render"):
+            match.render()
+        freed += sum(event["cells"] for event in match.world.events if event["type"] == "death")
+
+        # Bring everyone back for the next round
+        match.world.respawn()
+        match.sync_snakes()
+
+    return {"cells_freed_per_repeat": freed // args.repeat}
+
+
+def scenario_full_repaint(args, timings):
+    """The whole board changing owner every frame, the worst case for the territory layer."""
+    match = make_game(args.size, args.players, args.grid_size)
+    for frame in range(args.ticks):
+        match.world.territory.fill_rect(0, 0, args.size, args.size, frame % len(match.players) + 1)
+        with timings.time("render"):
+            match.render()
+    return {}
+
+
+def scenario_scrolling(args, timings):
+    """A board far bigger than the screen, with the camera following the players around it every frame."""
+    screen = pygame.display.set_mode((args.size * args.grid_size, args.size * args.grid_size))
+    match = game.Game(screen, args.grid_size, board_size=(args.size * 50, args.size * 50))
+    policy = ScriptedPolicy(args.seed)
+
+    for _ in range(args.ticks):
+        inputs = policy(match.world)
+        with timings.time("tick"):
+            match.world.step(inputs)
+        match.sync_snakes()
+        with timings.time("render"):
+            match.render()
+    return {"board_cells": match.world.width * match.world.height, "chunks_allocated": len(match.world.territory.grid.chunks)}
+
+
+def scenario_bots(args, timings):
+    """--players bots playing each other on an MxM board, seen through a camera no bigger than a normal window."""
+    view = min(args.size * args.grid_size, 800)
+    screen = pygame.display.set_mode((view, view))
+    match = game.Game(screen, args.grid_size, seed=args.seed, board_size=(args.size, args.size), bot_count=args.players, bot_workers=args.workers)
+    match.world.step = timings.wrap("step", match.world.step)
+    match.world.capture_engine = timings.wrap("capture", match.world.capture_engine)
+    match.world.clear_dead = timings.wrap("death", match.world.clear_dead)
+    match.bots.take = timings.wrap("bots", match.bots.take)
+    match.bots.request = timings.wrap("bots", match.bots.request)
+
+    events = {"capture": 0, "death": 0}
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        with timings.time("tick"):
+            match.tick()
+        for event in match.world.events:
+            if event["type"] in events:
+                events[event["type"]] += 1
+        with timings.time("render"):
+            match.render()
+    seconds = time.perf_counter() - start
+    match.bots.close()
+    return {"ticks_per_second": args.ticks / seconds, "captures": events["capture"], "deaths": events["death"]}
+
+
+def scenario_spectator(args, timings):
+    """--players bots on a board of --size x 50 cells a side (2000 by default), all of it on a 1280x720 screen through
+    the spectator view."""
+    screen = pygame.display.set_mode((1280, 720))
+    size = args.size * 50
+    with timings.time("setup"):
+        match = game.Game(screen, args.grid_size, seed=args.seed, board_size=(size, size), bot_count=args.players, bot_workers=args.workers)
+    match.spectating = True
+    match.world.step = timings.wrap("step", match.world.step)
+
+    for _ in range(args.ticks):
+        with timings.time("tick"):
+            match.tick()
+        with timings.time("render"):
+            match.render()
+    match.bots.close()
+    spectator = match.spectator_map
+    return {"board_cells": match.world.width * match.world.height, "cells_per_pixel": spectator.scale ** 2,
+            "map_size": list(spectator.surface.get_size())}
+
+
+def scenario_spawns(args, timings):
+    """Players dying and coming back one at a time on a board mostly covered in territory, the hard case for spawning."""
+    match = world.World(args.size, args.size, seed=args.seed)
+    for player_id in range(1, args.players + 1):
+        match.join(player_id)
+
+    # Squares of territory over most of the board, leaving the odd gap to spawn in. They belong to owners that aren't
+    # playing, so nobody dying frees them up.
+    rng = np.random.default_rng(args.seed)
+    side = max(3, int(args.size / np.sqrt(args.players)))
+    for owner in range(args.players + 1, 2 * args.players + 1):
+        x, y = rng.integers(0, max(1, args.size - side), 2)
+        match.territory.fill_rect(int(x), int(y), side, side, owner)
+
+    painted = 0
+    for tick in range(args.ticks):
+        player_id = tick % args.players + 1
+        if player_id in match.players:
+            match.kill(match.players[player_id])
+            match.clear_dead()
+        match.spawns.update()
+        free = match.spawns.free.any()
+        with timings.time("spawn"):
+            match.respawn()
+        x, y = match.players[player_id].head
+
+        # Count the spawns that landed on somebody while there was still room
+        around = match.territory.read(max(x - 1, 0), max(y - 1, 0), x + 2, y + 2)
+        painted += bool(free and (around != player_id).any())
+    return {"free_blocks": int(match.spawns.free.sum()), "blocks": match.spawns.free.size, "spawns_on_somebody": painted}
+
+
+def scenario_envs(args, timings):
+    """--envs matches of two players on an MxM board stepped together through envs.VectorEnv, playing at random."""
+    env = envs.VectorEnv(args.envs, args.size, args.size, players=2, seed=args.seed)
+    actions = np.random.default_rng(args.seed)
+    episodes = 0
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        batch = np.where(actions.random((args.envs, 2)) < 0.2, actions.integers(0, 4, (args.envs, 2)), envs.KEEP)
+        with timings.time("step"):
+            observations, rewards, dones = env.step(batch)
+        episodes += int(dones.sum())
+    return {"env_steps_per_second": args.envs * args.ticks / (time.perf_counter() - start), "episodes": episodes}
+
+
+SCENARIOS = {
+    "ticks": scenario_ticks,
+    "long_trails": scenario_long_trails,
+    "big_capture": scenario_big_capture,
+    "mass_deaths": scenario_mass_deaths,
+    "full_repaint": scenario_full_repaint,
+    "scrolling": scenario_scrolling,
+    "bots": scenario_bots,
+    "spawns": scenario_spawns,
+    "spectator": scenario_spectator,
+    "envs": scenario_envs,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the tick, capture and render phases of Paper-io.")
+    parser.add_argument("scenarios", nargs="*", choices=[[]] + list(SCENARIOS), help="scenarios to run, all of them by default")
+    parser.add_argument("--size", type=int, default=40, help="board size in cells")
+    parser.add_argument("--players", type=int, default=8)
+    parser.add_argument("--ticks", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--grid-size", type=int, default=4, help="pixels per cell when rendering")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--envs", type=int, default=1000, help="matches stepped at once in the envs scenario")
+    parser.add_argument("--workers", type=int, default=0, help="processes to decide bots in, 0 to decide them in this one")
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    pygame.font.init()
+
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        timings = Timings()
+        extra = SCENARIOS[name](args, timings)
+        results[name] = {"phases": timings.summary(), **extra}
+    results = {"params": {key: value for key, value in vars(args).items() if key not in ("scenarios", "output")}, "scenarios": results}
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
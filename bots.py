@@ -0,0 +1,249 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import world
+
+# Computer players. Every bot is decided at once each tick: the cells around every bot's head are looked up in one go,
+# each of the four directions gets a score, and the best one wins. The decisions go into the game's input buffers like
+# key presses, so bots play through exactly the same path as people do.
+#
+# A bot walks rectangles out of its own area: straight for a leg, turn, straight for a leg, and so on, heading home
+# once its trail is as long as it wants to risk, or sooner if somebody gets close.
+
+CLOCKWISE = np.array([world.DIRECTION_NAMES.index(name) for name in ("up", "down", "right", "left")])
+
+# How long legs and whole loops are, in cells
+MIN_LEG, MAX_LEG = 3, 10
+MIN_LOOP, MAX_LOOP = 8, 40
+
+# What each thing is worth when scoring a direction
+BLOCKED = -1e9
+OWN_TRAIL = -1e6
+KILL = 1000
+HOME = 500
+HOME_PULL = 10
+PLAN = 50
+LEAVE = 20
+NOISE = 5
+
+# Enemy heads further away than this are never a threat
+THREAT_RANGE = MAX_LOOP + 2
+
+# How often a random bot turns
+TURN_CHANCE = 0.2
+
+
+def nearest_enemies(ids, heads, enemy_ids, enemy_heads, reach):
+    """Returns the distance (in moves) from each head to the nearest enemy head, or reach if none is nearer.
+
+    Heads are put in buckets reach cells wide, so only the 3 x 3 buckets around a head can hold one within reach and
+    the work grows with the number of heads rather than its square.
+    """
+    nearest = np.full(len(heads), reach, dtype=np.int64)
+    if not len(enemy_heads) or not len(heads):
+        return nearest
+
+    size = reach + 1
+    stride = 1 << 20
+    keys = (enemy_heads[:, 0] // size) * stride + enemy_heads[:, 1] // size
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    buckets = heads // size
+
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            wanted = (buckets[:, 0] + dx) * stride + buckets[:, 1] + dy
+            low, high = np.searchsorted(keys, wanted, "left"), np.searchsorted(keys, wanted, "right")
+            counts = high - low
+            if not counts.any():
+                continue
+
+            # Every (head, enemy in that bucket) pair, flattened
+            head = np.repeat(np.arange(len(heads)), counts)
+            enemy = order[np.repeat(low - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+            distance = np.abs(heads[head] - enemy_heads[enemy]).sum(axis=1)
+            distance[ids[head] == enemy_ids[enemy]] = reach
+            np.minimum.at(nearest, head, distance)
+
+    return nearest
+
+
+def decide(batch):
+    """Returns the direction index each bot in batch should take. batch is a dict of arrays with a row per bot, see
+    Bots.batch. Only uses numpy, so a batch can be decided in another process just as well."""
+    heads, direction, drawing = batch["heads"], batch["direction"], batch["drawing"]
+    count = len(heads)
+    rows = np.arange(count)
+    scores = batch["noise"] * NOISE
+
+    # Walls, and turning back on a trail, are never allowed
+    nxt = heads[:, None, :] + world.VECTORS[None, :, :]
+    scores[~batch["in_bounds"]] = BLOCKED
+    reverse = (direction >= 0) & drawing
+    scores[rows[reverse], world.OPPOSITE[direction[reverse]]] = BLOCKED
+
+    me = batch["ids"][:, None]
+    scores += np.where(batch["trails"] == me, OWN_TRAIL, 0)
+    scores += np.where((batch["trails"] != 0) & (batch["trails"] != me), KILL, 0)
+
+    # Head home when the trail is long enough, or when another head is close enough to cut it off
+    reach = np.minimum(batch["trail_lengths"] + 2, THREAT_RANGE)
+    nearest = nearest_enemies(batch["ids"], heads, batch["enemy_ids"], batch["enemy_heads"], THREAT_RANGE)
+    going_home = drawing & ((batch["trail_lengths"] >= batch["targets"]) | (nearest <= reach))
+    home_distance = np.abs(nxt - batch["homes"][:, None, :]).sum(axis=2)
+    scores[going_home] += HOME * (batch["owners"][going_home] == me[going_home]) - HOME_PULL * home_distance[going_home]
+
+    # Otherwise follow the rectangle: straight until the leg is done, then turn the bot's way
+    moving = direction >= 0
+    turn = np.where(batch["senses"] > 0, CLOCKWISE[direction], world.OPPOSITE[CLOCKWISE[direction]])
+    plan = np.where(batch["legs"] < batch["leg_lengths"], direction, turn)
+    planned = ~going_home & moving
+    scores[rows[planned], plan[planned]] += PLAN
+
+    # At home, anywhere that isn't home yet is where the next loop starts
+    at_home = ~drawing
+    scores[at_home] += LEAVE * (batch["owners"][at_home] != me[at_home])
+
+    return scores.argmax(axis=1)
+
+
+class Bots:
+    """A set of bot players in a world. Call request() after a tick and take() before the next one, the time in
+    between is when a process pool (workers > 0) works the decisions out."""
+
+    def __init__(self, match, player_ids, seed=None, workers=0):
+        self.world = match
+        self.ids = np.array(player_ids, dtype=np.int64)
+        self.random = np.random.default_rng(seed)
+
+        count = len(self.ids)
+        self.legs = np.zeros(count, dtype=np.int64)
+        self.leg_lengths = self.random.integers(MIN_LEG, MAX_LEG + 1, count)
+        self.targets = self.random.integers(MIN_LOOP, MAX_LOOP + 1, count)
+        self.senses = self.random.choice([-1, 1], count)
+
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(workers) if workers else None
+
+        # (rows of the bots asked about, the decision or the futures working it out)
+        self.pending = None
+
+    def batch(self):
+        """Everything decide() needs for every living bot, and which rows of self.ids those bots are."""
+        players = self.world.players
+        rows = np.array([row for row, player_id in enumerate(self.ids.tolist()) if player_id in players], dtype=np.int64)
+        bots = [players[player_id] for player_id in self.ids[rows].tolist()]
+        count = len(bots)
+
+        heads = np.array([player.head for player in bots], dtype=np.int64).reshape(count, 2)
+        direction = np.array([world.DIRECTION_NAMES.index(player.direction) if player.direction else -1 for player in bots], dtype=np.int64)
+        drawing = np.array([player.drawing for player in bots], dtype=bool)
+        homes = np.array([player.body[-1] if player.body else player.head for player in bots], dtype=np.int64).reshape(count, 2)
+
+        # A turn only takes effect after the move the player is already set on, so decide from where that move ends
+        ahead = heads + np.where(direction[:, None] >= 0, world.VECTORS[direction], 0)
+        inside = (ahead[:, 0] >= 0) & (ahead[:, 0] < self.world.width) & (ahead[:, 1] >= 0) & (ahead[:, 1] < self.world.height)
+        heads = np.where(inside[:, None], ahead, heads)
+
+        # New loops get new sizes
+        home = rows[~drawing]
+        self.targets[home] = self.random.integers(MIN_LOOP, MAX_LOOP + 1, len(home))
+        self.leg_lengths[home] = self.random.integers(MIN_LEG, MAX_LEG + 1, len(home))
+
+        # Look up all four cells around every head at once, walls reading as nobody's
+        nxt = heads[:, None, :] + world.VECTORS[None, :, :]
+        in_bounds = (nxt[..., 0] >= 0) & (nxt[..., 0] < self.world.width) & (nxt[..., 1] >= 0) & (nxt[..., 1] < self.world.height)
+        flat = (np.clip(nxt[..., 1], 0, self.world.height - 1) * self.world.width + np.clip(nxt[..., 0], 0, self.world.width - 1)).ravel()
+        owners = np.where(in_bounds, self.world.territory.grid.take(flat).reshape(count, 4), 0)
+        trails = np.where(in_bounds, self.world.trails.grid.take(flat).reshape(count, 4), 0)
+
+        enemies = list(players.values())
+        return rows, {
+            "ids": self.ids[rows],
+            "heads": heads,
+            "direction": direction,
+            "drawing": drawing,
+            "homes": homes,
+            "trail_lengths": np.array([len(player.body) for player in bots], dtype=np.int64),
+            "targets": self.targets[rows],
+            "legs": self.legs[rows],
+            "leg_lengths": self.leg_lengths[rows],
+            "senses": self.senses[rows],
+            "in_bounds": in_bounds,
+            "owners": owners.astype(np.int64),
+            "trails": trails.astype(np.int64),
+            "enemy_ids": np.array([player.id for player in enemies], dtype=np.int64),
+            "enemy_heads": np.array([player.head for player in enemies], dtype=np.int64).reshape(len(enemies), 2),
+            "noise": self.random.random((count, 4)),
+        }
+
+    def request(self):
+        """Starts deciding what every bot does next, from the world as it is now."""
+        rows, batch = self.batch()
+        if self.pool is None or not len(rows):
+            self.pending = (rows, decide(batch))
+            return
+
+        # Split the bots between the workers. Enemy heads are needed by every part, everything else is per bot.
+        shared = ("enemy_ids", "enemy_heads")
+        parts = np.array_split(np.arange(len(rows)), self.workers)
+        futures = [self.pool.submit(decide, {key: value if key in shared else value[part] for key, value in batch.items()})
+                   for part in parts if len(part)]
+        self.pending = (rows, futures)
+
+    def take(self):
+        """Returns player id -> direction for every bot that wants to turn, deciding now if nothing was requested."""
+        if self.pending is None:
+            self.request()
+        rows, choice = self.pending
+        self.pending = None
+        if isinstance(choice, list):
+            choice = np.concatenate([future.result() for future in choice]) if choice else np.zeros(0, dtype=np.int64)
+
+        inputs = {}
+        players = self.world.players
+        for row, player_id, direction in zip(rows.tolist(), self.ids[rows].tolist(), choice.tolist()):
+            player = players.get(player_id)
+            if player is None:
+                continue
+            name = world.DIRECTION_NAMES[direction]
+            self.legs[row] = self.legs[row] + 1 if name == player.direction else 0
+            if name != player.input_direction:
+                inputs[player_id] = name
+        return inputs
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+
+
+class RandomBots:
+    """Bots that turn somewhere random every so often, as something for Bots to be measured against. Works the same
+    way as Bots, so the two can be swapped."""
+
+    def __init__(self, match, player_ids, seed=None, workers=0):
+        self.world = match
+        self.ids = list(player_ids)
+        self.random = np.random.default_rng(seed)
+
+    def request(self):
+        pass
+
+    def take(self):
+        turns = self.random.random(len(self.ids)) < TURN_CHANCE
+        choice = self.random.integers(0, len(world.DIRECTION_NAMES), len(self.ids))
+        inputs = {}
+        for player_id, turn, direction in zip(self.ids, turns.tolist(), choice.tolist()):
+            player = self.world.players.get(player_id)
+            if player is not None and (turn or player.input_direction is None):
+                inputs[player_id] = world.DIRECTION_NAMES[direction]
+        return inputs
+
+    def close(self):
+        pass
+
+
+# Every kind of bot, by name
+STRATEGIES = {"loops": Bots, "random": RandomBots}
@@ -0,0 +1,181 @@
+from collections import deque
+
+import numpy as np
+
+import pathfinder
+import profiling
+
+# When a player gets back to its own area the cells it has enclosed become its own. There are two ways of working out
+# which cells those are:
+#   "polygon" - the original approach. Close the trail into an outline through the player's area and ray-cast every
+#               cell of the outline's bounding box against every vertex of the outline. O(cells * outline length).
+#   "flood"   - treat the player's area (trail included) as walls and flood the rest of the board from its edge.
+#               Whatever the flood can't reach is enclosed. Linear in the size of the player's bounding box.
+
+# How far around the trail the polygon engine first looks for a path home
+PATH_MARGIN = 8
+
+
+def is_point_in_polygon(point, polygon):
+    """Uses the ray-casting algorithm to determine if a point is in the polygon."""
+    x_intersections = 0
+    px, py = point
+    n = len(polygon)
+
+    for i in range(n):
+        x1, y1 = polygon[i]
+        x2, y2 = polygon[(i + 1) % n]  # Wrap around to the first point for the last segment
+
+        # Check if point is on the same y-coordinate and between the y-coordinates of the segment
+        if (y1 > py) != (y2 > py):
+            # Compute the x coordinate of the intersection of the line with the y-coordinate of the point
+            x_intersect = (x2 - x1) * (py - y1) / (y2 - y1) + x1
+
+            # Check if the point is to the left of the test point
+            if px < x_intersect:
+                x_intersections += 1
+
+    # Point is inside if the number of intersections is odd
+    return x_intersections % 2 == 1
+
+
+def points_within_polygon(polygon, grid_size=1):
+    """Returns all integer points within the polygon."""
+    min_x = min(polygon, key=lambda p: p[0])[0]
+    max_x = max(polygon, key=lambda p: p[0])[0]
+    min_y = min(polygon, key=lambda p: p[1])[1]
+    max_y = max(polygon, key=lambda p: p[1])[1]
+    points_inside = []
+
+    for x in range(int(min_x) // grid_size, (int(max_x) + (grid_size * 3)) // grid_size):
+        for y in range(int(min_y) // grid_size, (int(max_y) + grid_size) // grid_size):
+            if is_point_in_polygon((x * grid_size, y * grid_size), polygon):
+                points_inside.append((x * grid_size, y * grid_size))
+
+    return points_inside
+
+
+def bfs_shortest_path(grid, start, end, grid_size=1):
+    directions = [(-grid_size, 0), (grid_size, 0), (0, -grid_size), (0, grid_size)]  # Up, Down, Left, Right
+
+    grid_set = set(grid)
+
+    # Every cell remembers where it was reached from rather than carrying its own copy of the path
+    parents = {start: None}
+    queue = deque([start])
+
+    while queue:
+        r, c = queue.popleft()
+
+        if (r, c) == end:
+            return pathfinder.walk_back(parents, (r, c))[::-1]
+
+        for dr, dc in directions:
+            nr, nc = r + dr, c + dc
+
+            if (nr, nc) in grid_set and (nr, nc) not in parents:
+                parents[(nr, nc)] = (r, c)
+                queue.append((nr, nc))
+
+    print("no path found")
+    return []
+
+
+def enclosed_cells(walls):
+    """Returns a mask of the cells in walls that are not walls and can't reach the edge of the array."""
+    height, width = walls.shape
+    if not height or not width:
+        return np.zeros_like(walls)
+
+    # Rather than flooding cell by cell, flood whole horizontal runs of open cells. Find where each run starts and ends
+    # (end is exclusive). np.nonzero is row major, so the n-th start and n-th end belong to the same run.
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = ~walls
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]
+    if not rows.size:
+        return np.zeros_like(walls)
+
+    # first_run[r]:first_run[r + 1] are the runs on row r
+    first_run = np.searchsorted(rows, np.arange(height + 1))
+
+    # Runs touching the edge of the array are where the flood starts
+    reached = (rows == 0) | (rows == height - 1) | (starts == 0) | (ends == width)
+    stack = np.nonzero(reached)[0].tolist()
+    starts_list, ends_list, rows_list = starts.tolist(), ends.tolist(), rows.tolist()
+
+    while stack:
+        run = stack.pop()
+        row, start, end = rows_list[run], starts_list[run], ends_list[run]
+
+        for next_row in (row - 1, row + 1):
+            if not 0 <= next_row < height:
+                continue
+
+            # The runs on a row are sorted, so skip straight to the first one that ends after this one starts
+            lo, hi = first_run[next_row], first_run[next_row + 1]
+            other = lo + int(np.searchsorted(ends[lo:hi], start, side="right"))
+            while other < hi and starts_list[other] < end:
+                if not reached[other]:
+                    reached[other] = True
+                    stack.append(other)
+                other += 1
+
+    # Paint every run the flood didn't reach back onto a mask
+    enclosed = ~reached
+    marks = np.zeros((height, width + 1), dtype=np.int32)
+    np.add.at(marks, (rows[enclosed], starts[enclosed]), 1)
+    np.add.at(marks, (rows[enclosed], ends[enclosed]), -1)
+    return np.cumsum(marks, axis=1)[:, :width] > 0
+
+
+def flood_capture(territory, player_id, trail, head):
+    territory.fill(trail, player_id)
+
+    # Nothing outside the bounding box of the player's area can be enclosed by it. The box is grown by a cell on each
+    # side so the flood always has somewhere to start from.
+    x0, y0, x1, y1 = territory.bounds(player_id)
+    x0, y0 = max(x0 - 1, 0), max(y0 - 1, 0)
+    x1, y1 = min(x1 + 1, territory.width), min(y1 + 1, territory.height)
+
+    walls = territory.read(x0, y0, x1, y1) == player_id
+    with profiling.profiler.span("enclosed_cells"):
+        enclosed = enclosed_cells(walls)
+    territory.fill_mask(x0, y0, enclosed, player_id)
+
+
+def polygon_capture(territory, player_id, trail, head):
+    # shortest path between tail and head through the area the player owned before this trail. The search is kept
+    # to a box around the trail first, as that is nearly always where the path is, and only goes further if it has to.
+    width, height = territory.width, territory.height
+    owned = territory.owned.get(player_id, set())
+    start, end = head[1] * width + head[0], trail[-1][1] * width + trail[-1][0]
+    xs, ys = [cell[0] for cell in trail], [cell[1] for cell in trail]
+    bounds = (min(xs) - PATH_MARGIN, min(ys) - PATH_MARGIN, max(xs) + PATH_MARGIN + 1, max(ys) + PATH_MARGIN + 1)
+
+    with profiling.profiler.span("shortest_path"):
+        close_path = pathfinder.shortest_path(owned, width, height, start, end, bounds)
+        if not close_path:
+            close_path = pathfinder.shortest_path(owned, width, height, start, end)
+    close_path = [(cell % width, cell // width) for cell in close_path]
+
+    # Add the body to the area
+    territory.fill(trail, player_id)
+
+    # Get cords of body path and close hole across owned locations
+    outline = close_path + list(reversed(trail))
+
+    # Add all points within path to area
+    with profiling.profiler.span("points_within_polygon"):
+        new_points = points_within_polygon(outline)
+    if new_points:
+        territory.fill(new_points, player_id)
+
+
+ENGINES = {"flood": flood_capture, "polygon": polygon_capture}
+
+
+def engine_name(engine):
+    """The name an engine goes by in ENGINES, for saving which one a world uses."""
+    return next(name for name, function in ENGINES.items() if function is engine)
@@ -0,0 +1,124 @@
+import numpy as np
+
+# A big arena is mostly empty, so grids of the whole board are kept as square chunks that only get allocated the first
+# time something is written to them. A missing chunk reads as all zeros.
+CHUNK_SIZE = 64
+
+
+class ChunkedGrid:
+    """A width x height grid of uint16 values, stored as CHUNK_SIZE x CHUNK_SIZE numpy chunks allocated on write.
+
+    Cells are addressed as (x, y), or as flat y * width + x indices for the batched reads and writes.
+    """
+
+    def __init__(self, width, height, chunk_size=CHUNK_SIZE):
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.columns = -(-width // chunk_size)
+        self.rows = -(-height // chunk_size)
+
+        # (chunk x, chunk y) -> array indexed [y, x] like the rest of the numpy code
+        self.chunks = {}
+
+    def chunk(self, cx, cy):
+        """Returns the chunk at (cx, cy), allocating it if it has never been written to."""
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None:
+            chunk = self.chunks[(cx, cy)] = np.zeros((self.chunk_size, self.chunk_size), dtype=np.uint16)
+        return chunk
+
+    def get(self, x, y):
+        size = self.chunk_size
+        chunk = self.chunks.get((x // size, y // size))
+        return 0 if chunk is None else int(chunk[y % size, x % size])
+
+    def set(self, x, y, value):
+        size = self.chunk_size
+        chunk = self.chunks.get((x // size, y // size))
+        if chunk is None:
+            if not value:
+                return
+            chunk = self.chunk(x // size, y // size)
+        chunk[y % size, x % size] = value
+
+    def group(self, flat):
+        # Splits flat indices up by the chunk they fall in, yielding (chunk key, local x, local y, positions in flat)
+        size = self.chunk_size
+        xs, ys = flat % self.width, flat // self.width
+        keys = (ys // size) * self.columns + xs // size
+        first = keys[0]
+        if (keys == first).all():
+            # By far the common case, a change that fits in one chunk
+            yield divmod(int(first), self.columns)[::-1], xs % size, ys % size, slice(None)
+            return
+
+        order = np.argsort(keys, kind="stable")
+        starts = np.flatnonzero(np.diff(keys[order])) + 1
+        for positions in np.split(order, starts):
+            key = int(keys[positions[0]])
+            yield divmod(key, self.columns)[::-1], xs[positions] % size, ys[positions] % size, positions
+
+    def take(self, flat):
+        """Returns the values of the cells in flat (an array of y * width + x indices)."""
+        values = np.zeros(len(flat), dtype=np.uint16)
+        if len(flat):
+            for key, xs, ys, positions in self.group(flat):
+                chunk = self.chunks.get(key)
+                if chunk is not None:
+                    values[positions] = chunk[ys, xs]
+        return values
+
+    def put(self, flat, value):
+        """Sets every cell in flat to value."""
+        if len(flat):
+            for key, xs, ys, positions in self.group(flat):
+                chunk = self.chunks.get(key)
+                if chunk is None:
+                    if not value:
+                        continue
+                    chunk = self.chunk(*key)
+                chunk[ys, xs] = value
+
+    def read(self, x0, y0, x1, y1):
+        """Returns a copy of the box x0 <= x < x1, y0 <= y < y1 as one dense array, indexed [y, x]."""
+        size = self.chunk_size
+        block = np.zeros((max(y1 - y0, 0), max(x1 - x0, 0)), dtype=np.uint16)
+        for cy in range(y0 // size, (y1 - 1) // size + 1):
+            for cx in range(x0 // size, (x1 - 1) // size + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is None:
+                    continue
+                # The part of the box this chunk covers, in board coordinates
+                bx0, by0 = max(x0, cx * size), max(y0, cy * size)
+                bx1, by1 = min(x1, (cx + 1) * size), min(y1, (cy + 1) * size)
+                block[by0 - y0:by1 - y0, bx0 - x0:bx1 - x0] = chunk[by0 - cy * size:by1 - cy * size, bx0 - cx * size:bx1 - cx * size]
+        return block
+
+    def nonzero(self):
+        """Returns every cell that isn't 0, as sorted flat indices, and their values."""
+        size = self.chunk_size
+        flat, values = [], []
+        for (cx, cy), chunk in self.chunks.items():
+            ys, xs = chunk.nonzero()
+            flat.append((ys + cy * size) * self.width + xs + cx * size)
+            values.append(chunk[ys, xs])
+        if not flat:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.uint16)
+        flat, values = np.concatenate(flat), np.concatenate(values)
+        order = np.argsort(flat)
+        return flat[order], values[order]
+
+    def tobytes(self):
+        """The used chunks in a fixed order, so two grids with the same values give the same bytes however they got
+        there (an emptied chunk is left out just like one that was never allocated)."""
+        parts = []
+        for key in sorted(self.chunks):
+            chunk = self.chunks[key]
+            if chunk.any():
+                parts.append(np.array(key, dtype=np.int32).tobytes() + chunk.tobytes())
+        return b"".join(parts)
+
+    def clear(self):
+        self.chunks = {}
+
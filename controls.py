@@ -0,0 +1,41 @@
+import pygame
+
+# The order directions appear in a player's list of controls
+CONTROL_DIRECTIONS = ("left", "right", "up", "down")
+
+
+class InputMap:
+    """Looks key presses up in one table and holds them per player until the next tick."""
+
+    def __init__(self):
+        # key -> (player id, direction)
+        self.bindings = {}
+
+        # player id -> directions pressed since the last tick, in order
+        self.pending = {}
+
+    def bind(self, player_id, controls):
+        if len(controls) < 4:
+            print("Not enough controls")
+
+        for key, direction in zip(controls, CONTROL_DIRECTIONS):
+            self.bindings[key] = (player_id, direction)
+
+    def handle_event(self, event):
+        """Buffers the event if it is one of the bound keys. Returns True if it was."""
+        if event.type != pygame.KEYDOWN:
+            return False
+
+        binding = self.bindings.get(event.key)
+        if binding is None:
+            return False
+
+        player_id, direction = binding
+        self.pending.setdefault(player_id, []).append(direction)
+        return True
+
+    def take(self):
+        """Returns and clears everything pressed since the last call, as player id -> list of directions."""
+        pending = self.pending
+        self.pending = {}
+        return pending
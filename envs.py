@@ -0,0 +1,191 @@
+import numpy as np
+
+import capture
+import spawning
+import world
+
+# Many matches stepped at once, for training and evaluating bots. It plays by the same rules as world.World (moves,
+# trails, captures and collisions happen in the same order, see World.advance), but every match lives in one slice
+# of a stack of arrays and each rule is applied to all the matches together. Only players are looped over.
+#
+# A match ends as soon as somebody dies (or after max_steps), and is started again straight away.
+
+# An action is an index into world.DIRECTION_NAMES, or this to keep going the same way
+KEEP = -1
+
+
+class VectorEnv:
+    """count matches of players players each on a width x height board.
+
+    step() takes a (count, players) array of actions and returns (observations, rewards, dones):
+      observations  dict of "owners" (count, height, width) player ids, 0 for nobody
+                            "trails" (count, players, height, width) True where that player's trail is
+                            "heads" (count, players, 2) x, y
+                            "drawing" (count, players)
+      rewards       (count, players) change in the number of cells each player owns
+      dones         (count,) True for matches that ended, whose observations are already of the next match
+    Player ids on the board are 1 to players, so column i of actions and rewards is player i + 1.
+    """
+
+    def __init__(self, count, width=32, height=32, players=2, max_steps=1000, seed=None):
+        self.count = count
+        self.width = width
+        self.height = height
+        self.players = players
+        self.max_steps = max_steps
+        self.random = np.random.default_rng(seed)
+
+        # Players spawn in blocks of their own, see reset
+        self.block_columns = width // spawning.SPAWN_BLOCK
+        blocks = self.block_columns * (height // spawning.SPAWN_BLOCK)
+        if blocks < players:
+            raise ValueError(f"A {width}x{height} board only has room to spawn {blocks} players")
+
+        self.owners = np.zeros((count, height, width), dtype=np.uint8)
+        self.trails = np.zeros((count, players, height, width), dtype=bool)
+        self.heads = np.zeros((count, players, 2), dtype=np.int64)
+        self.direction = np.full((count, players), KEEP, dtype=np.int64)
+        self.input_direction = np.full((count, players), KEEP, dtype=np.int64)
+        self.drawing = np.zeros((count, players), dtype=bool)
+        self.alive = np.ones((count, players), dtype=bool)
+
+        # Cells owned by each player, only recounted for the matches where something changed hands
+        self.cells = np.zeros((count, players), dtype=np.int64)
+        self.changed = set()
+
+        # A player at home has a body of at most one cell, the cell it was on before (which the trail grid has too)
+        self.home_body = np.zeros((count, players), dtype=bool)
+        self.steps = np.zeros(count, dtype=np.int64)
+
+        self.reset()
+
+    def reset(self, matches=None):
+        """Starts the given matches (all of them by default) again, with every player spawned somewhere random."""
+        matches = np.arange(self.count) if matches is None else np.asarray(matches)
+        if not len(matches):
+            return self.observe()
+
+        self.owners[matches] = 0
+        self.trails[matches] = False
+        self.direction[matches] = KEEP
+        self.input_direction[matches] = KEEP
+        self.drawing[matches] = False
+        self.alive[matches] = True
+        self.home_body[matches] = False
+        self.steps[matches] = 0
+
+        # Like World.spawn on an empty board: a 3 x 3 block in the middle of a spawn block nobody else is in
+        blocks = self.block_columns * (self.height // spawning.SPAWN_BLOCK)
+        chosen = self.random.random((len(matches), blocks)).argsort(axis=1)[:, :self.players]
+        xs = chosen % self.block_columns * spawning.SPAWN_BLOCK + spawning.SPAWN_BLOCK // 2
+        ys = chosen // self.block_columns * spawning.SPAWN_BLOCK + spawning.SPAWN_BLOCK // 2
+        self.heads[matches] = np.stack((xs, ys), axis=2)
+        columns, rows = np.arange(self.width), np.arange(self.height)
+        for player in range(self.players):
+            near_x = np.abs(columns[None, :] - xs[:, player, None]) <= 1
+            near_y = np.abs(rows[None, :] - ys[:, player, None]) <= 1
+            block = near_y[:, :, None] & near_x[:, None, :]
+            self.owners[matches] = np.where(block, player + 1, self.owners[matches])
+        self.recount(matches)
+        return self.observe()
+
+    def observe(self):
+        return {
+            "owners": self.owners.copy(),
+            "trails": self.trails.copy(),
+            "heads": self.heads.copy(),
+            "drawing": self.drawing.copy(),
+        }
+
+    def recount(self, matches):
+        # Cells owned by each player of the given matches, in one bincount
+        if not len(matches):
+            return
+        ids = self.owners[matches].reshape(len(matches), -1) + (np.arange(len(matches)) * (self.players + 1))[:, None]
+        self.cells[matches] = np.bincount(ids.ravel(), minlength=len(matches) * (self.players + 1)).reshape(len(matches), -1)[:, 1:]
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.int64).reshape(self.count, self.players)
+        before = self.cells.copy()
+
+        # Steering, with the same rule as Player.steer
+        turning = (actions >= 0) & ((self.direction != world.OPPOSITE[actions]) | ~self.drawing)
+        self.input_direction = np.where(turning, actions, self.input_direction)
+
+        for player in range(self.players):
+            self.advance(player)
+
+        # Clear the area of everyone who died this step, like World.clear_dead
+        dead = ~self.alive
+        lost = np.flatnonzero(dead.any(axis=1))
+        if len(lost):
+            ids = np.where(dead[lost], np.arange(1, self.players + 1), 0)
+            owners = self.owners[lost]
+            owners[(owners[:, None] == ids[:, :, None, None]).any(axis=1)] = 0
+            self.owners[lost] = owners
+            self.changed.update(lost.tolist())
+
+        self.recount(np.array(sorted(self.changed), dtype=np.int64))
+        self.changed.clear()
+        rewards = self.cells - before
+        self.steps += 1
+        dones = dead.any(axis=1) | (self.steps >= self.max_steps)
+        observations = self.reset(np.flatnonzero(dones))
+        return observations, rewards, dones
+
+    def advance(self, player):
+        # World.advance for one player of every match
+        active = np.flatnonzero(self.alive[:, player] & ((self.direction[:, player] >= 0) | (self.input_direction[:, player] >= 0)))
+        if not len(active):
+            return
+
+        moving = active[self.direction[active, player] >= 0]
+        if len(moving):
+            x, y = self.heads[moving, player, 0], self.heads[moving, player, 1]
+            drawing = self.drawing[moving, player]
+
+            # The body gets the head. At home it only keeps that one cell, so the cell it had before goes.
+            left = moving[~drawing & self.home_body[moving, player]]
+            if len(left):
+                self.trails[left, player] = False
+            self.trails[moving, player, y, x] = True
+            self.home_body[moving, player] = ~drawing
+
+            # Move, or stay put at a wall and take the head back off the body
+            nx, ny = x + world.VECTORS[self.direction[moving, player], 0], y + world.VECTORS[self.direction[moving, player], 1]
+            inside = (nx >= 0) & (nx < self.width) & (ny >= 0) & (ny < self.height)
+            self.heads[moving[inside], player] = np.stack((nx[inside], ny[inside]), axis=1)
+            walled = moving[~inside]
+            self.trails[walled, player, y[~inside], x[~inside]] = False
+            self.home_body[walled, player] = False
+
+        self.direction[active, player] = self.input_direction[active, player]
+
+        x, y = self.heads[active, player, 0], self.heads[active, player, 1]
+        home = self.owners[active, y, x] == player + 1
+        for match in active[home & self.drawing[active, player]].tolist():
+            self.capture(match, player)
+        self.drawing[active[~home], player] = True
+
+        # Running into a trail kills whoever it belongs to: other players only if they are out drawing
+        hit = self.trails[active, :, y, x]
+        others = hit & self.drawing[active] & self.alive[active]
+        others[:, player] = False
+        for match, other in zip(*np.nonzero(others)):
+            self.kill(active[match], other)
+        for match in active[hit[:, player]].tolist():
+            self.kill(match, player)
+
+    def capture(self, match, player):
+        # The flood engine from capture.py, on this match's board
+        owned = (self.owners[match] == player + 1) | self.trails[match, player]
+        self.owners[match][owned | capture.enclosed_cells(owned)] = player + 1
+        self.changed.add(match)
+        self.trails[match, player] = False
+        self.home_body[match, player] = False
+        self.drawing[match, player] = False
+
+    def kill(self, match, player):
+        self.trails[match, player] = False
+        self.home_body[match, player] = False
+        self.alive[match, player] = False
@@ -1,24 +1,60 @@
-import random
+import threading
+import time
 
 import pygame
+import random
+
+import assets
+import bots
+import controls
+import profiling
+import render
+import replay
+import resources
 import snakefile
+import snapshot
+import timestep
+import world
+
+# Where F5 quick saves to and F9 loads from
+QUICKSAVE = "quicksave.pios"
+
+# Where a recorded game is saved when it stops (whenever run() returns), see replay.py
+RECORDING = "paperio-replay-%Y%m%d-%H%M%S.pior"
+
+# Biggest the minimap gets on either side, in pixels
+MINIMAP_SIZE = 200
 
 
 class Game:
-    def __init__(self, main_screen):
-        self.font = pygame.font.Font('freesansbold.ttf', 35)
+    def __init__(self, main_screen, grid_size=20, seed=None, threaded=False, board_size=None, bot_count=0, bot_workers=0):
+        self.font = assets.manager.font('freesansbold.ttf', 35)
 
         self.screen = main_screen
         self.clock = pygame.time.Clock()
         self.fps = 60
-        self.grid_size = 20
+        self.grid_size = grid_size
+        self.render_cache = resources.RenderCache(self.font, self.grid_size)
 
-        # Create a "timer_event" which will be triggered evey "time_delay" milliseconds. This will act as an event which will be processed in the event loop.
+        # The simulation ticks every "time_delay" milliseconds, however often frames are drawn
         self.time_delay = 140
-        self.timer_event = pygame.USEREVENT + 1
-        pygame.time.set_timer(self.timer_event, self.time_delay)
+        self.timestep = timestep.FixedTimestep(self.time_delay)
+
+        # When drawing can't keep up with the simulation, skip up to this many frames in a row to let it catch up
+        self.max_frame_skip = 2
+
+        # The simulation can also run on its own thread, in which case the lock has to be held to touch the world
+        self.threaded = threaded
+        self.lock = threading.Lock()
 
-        self.area = {}
+        # The world holds the actual game state, the game just feeds it input and draws it.
+        # A seeded game plays out the same way every time for the same input, so it is recorded to be replayed later.
+        # The board is as big as the screen unless board_size (in cells) says otherwise, in which case it scrolls.
+        if board_size is None:
+            board_size = (self.screen.get_width() // self.grid_size, self.screen.get_height() // self.grid_size)
+        self.world = world.World(board_size[0], board_size[1], seed)
+        self.recorder = replay.Recorder(self.world) if seed is not None else None
+        self.recording_path = time.strftime(RECORDING) if self.recorder else None
 
         # We have created the class, now we need to create objects. This creates instances (in this case 2) of the Snake class allowing us to make as many as we want without having to repeat the snake's logic.
         self.snakes = pygame.sprite.Group()
@@ -28,47 +64,359 @@ class Game:
             {"display": "Green", "colour": pygame.color.Color(0, 200, 0), "controls": [pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s]},
             {"display": "Blue", "colour": pygame.color.Color(0, 0, 200), "controls": [pygame.K_j, pygame.K_l, pygame.K_i, pygame.K_k]},
         ]
+
+        # Bots come after the people and have no keys, they press theirs from bots.Bots
+        colours = random.Random(seed)
+        for _ in range(bot_count):
+            colour = pygame.Color(0)
+            colour.hsva = (colours.randrange(360), 80, 80, 100)
+            self.players.append({"display": f"Bot {len(self.players) + 1}", "colour": colour, "controls": None})
+
+        # Every player's keys go in one table, so a key press is a single lookup however many players there are
+        self.input_map = controls.InputMap()
+        for i, player in enumerate(self.players):
+            if player["controls"] is not None:
+                self.input_map.bind(i + 1, player["controls"])
+
+        # The camera shows the part of the board around the player it follows, or around all of them if follow is None
+        self.camera = render.Camera(self.screen.get_size(), (self.world.width * self.grid_size, self.world.height * self.grid_size))
+        self.follow = None
+        self.drawn_offset = None
+
+        # A minimap of the whole board sits in the corner whenever the board doesn't fit on screen (M shows and hides
+        # it), and Tab swaps the camera for a spectator view of the whole board. Both are made when first shown.
+        self.show_minimap = not self.camera.rect.contains(self.camera.board)
+        self.minimap = None
+        self.minimap_drawn = None
+        self.spectating = False
+        self.spectator_map = None
+
+        # The board is painted once onto its own surface and after that only cells that change are repainted.
+        # Trails get a see-through layer of their own on top, so a long trail costs nothing to draw until it changes.
+        self.territory_layer = render.CellLayer(self.world.territory, self.grid_size, {})
+        self.trail_layer = render.CellLayer(self.world.trails, self.grid_size, {}, background=None)
+        for i, player in enumerate(self.players):
+            self.set_player_colour(i + 1, player["colour"])
+
         for i in range(self.players.__len__()):
-            snake_pos = (random.randint(0, (self.screen.get_width()//self.grid_size) - 1) * self.grid_size, random.randint(0, (self.screen.get_height()//self.grid_size) - 1) * self.grid_size)
-            snakefile.Snake(self, snake_pos, self.players[i]["colour"], self.players[i]["controls"], self.snakes)
+            snakefile.Snake(self, self.world.join(i + 1), self.players[i]["colour"], self.snakes)
+
+        # All the bots are decided together, see bots.py. With bot_workers they are decided in other processes.
+        bot_ids = [i + 1 for i, player in enumerate(self.players) if player["controls"] is None]
+        self.bots = bots.Bots(self.world, bot_ids, seed, bot_workers) if bot_ids else None
+
+        # Only the biggest players fit on screen
+        self.leaderboard_rows = 10
+
+        # F3 turns the profiling spans and their frame-time graph on and off, F4 saves what they caught as a trace
+        self.frame_graph = None
+
+        # Rects drawn over the territory last frame (snakes and text), which have to be cleaned up next frame
+        self.drawn = []
 
     def run(self):
-        # This is the entire game loop. Look how much smaller and easier it is to read now that we are using objects!
-        while True:
-            # Event Loop
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    quit()
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        return "main_menu"
-                for snake in self.snakes:
-                    snake.handle_event(event)
+        # Redraw the whole screen to start with, as a menu may have been drawn over it
+        self.drawn_offset = None
 
-            for snake in self.snakes:
-                snake.update_display_rect()
+        # Time spent in a menu shouldn't be caught up on, so the clock starts again from here and the first frame
+        # counts no time at all
+        self.clock.tick()
+        self.timestep.reset()
+        elapsed = 0
+
+        simulation = None
+        if self.threaded:
+            simulation = timestep.SimulationThread(self.tick, self.time_delay, self.lock)
+            simulation.start()
+
+        try:
+            skipped = 0
+
+            # This is the entire game loop. Look how much smaller and easier it is to read now that we are using objects!
+            while True:
+                profiling.profiler.begin_frame()
+
+                # Event Loop
+                with profiling.profiler.span("events"):
+                    for event in pygame.event.get():
+                        if event.type == pygame.QUIT:
+                            pygame.quit()
+                            quit()
+                        if event.type == pygame.KEYDOWN:
+                            if event.key == pygame.K_ESCAPE:
+                                return "main_menu"
+                            if event.key == pygame.K_F3:
+                                profiling.profiler.toggle()
+                                self.drawn_offset = None
+                            elif event.key == pygame.K_F4:
+                                print("Saved a trace to", profiling.profiler.export())
+                            elif event.key == pygame.K_F5:
+                                with self.lock:
+                                    snapshot.save(self.world, QUICKSAVE)
+                            elif event.key == pygame.K_F9:
+                                with self.lock:
+                                    self.quick_load()
+                            elif event.key == pygame.K_TAB:
+                                self.spectating = not self.spectating
+                                self.drawn_offset = None
+                            elif event.key == pygame.K_m:
+                                self.show_minimap = not self.show_minimap
+                                self.drawn_offset = None
+                        with self.lock:
+                            self.input_map.handle_event(event)
+
+                if simulation:
+                    alpha = simulation.alpha
+                    behind = False
+                else:
+                    steps = self.timestep.advance(elapsed)
+                    for _ in range(steps):
+                        self.tick()
+                    alpha = self.timestep.alpha
+                    behind = steps > 1
+
+                if behind and skipped < self.max_frame_skip:
+                    skipped += 1
+                else:
+                    skipped = 0
+                    with self.lock:
+                        for snake in self.snakes:
+                            snake.update_display_rect(alpha)
+                        self.render()
+                profiling.profiler.end_frame()
+
+                elapsed = self.clock.tick(self.fps)
+                pygame.display.set_caption("FPS: " + str(int(self.clock.get_fps())))
+        finally:
+            if simulation:
+                simulation.stop()
+            self.save_recording()
+
+    def close(self):
+        # For when the game is thrown away, stops any processes the bots are decided in
+        if self.bots:
+            self.bots.close()
+
+    def save_recording(self):
+        # Saved over the same file every time, so it always holds the match so far
+        if self.recorder:
+            self.recorder.save(self.recording_path)
+            print("Saved a replay to", self.recording_path)
+
+    def quick_load(self):
+        try:
+            saved = snapshot.Snapshot(QUICKSAVE)
+        except (OSError, snapshot.SnapshotError) as error:
+            print("Couldn't load the quick save:", error)
+            return
+        if any(player_id > len(self.players) for player_id in saved.roster):
+            print("The quick save has players this game doesn't")
+            return
+        if (saved.width, saved.height, saved.chunk_size) != (self.world.width, self.world.height, self.world.territory.grid.chunk_size):
+            print(f"The quick save is of a {saved.width}x{saved.height} board, not {self.world.width}x{self.world.height}")
+            return
+
+        # The recording can't follow a jump to another point in the match, so it is saved while it still holds the
+        # match as it was played
+        if self.recorder:
+            self.save_recording()
+            print("Stopped recording, a loaded game can't be replayed")
+            self.recorder = None
+        saved.restore(self.world)
 
-            if len(self.snakes) < len(self.players):
-                for player in self.players:
-                    if player["colour"] not in [snake.colour for snake in self.snakes]:
-                        snake_pos = (random.randint(0, (self.screen.get_width() // self.grid_size) - 1) * self.grid_size, random.randint(0, (self.screen.get_height() // self.grid_size) - 1) * self.grid_size)
-                        snakefile.Snake(self, snake_pos, player["colour"], player["controls"], self.snakes)
+        # Every player is a different object now, so every snake is new
+        for snake in self.snakes:
+            snake.kill()
+        for player in self.world.players.values():
+            snakefile.Snake(self, player, self.players[player.id - 1]["colour"], self.snakes)
+        if self.bots:
+            self.bots.pending = None
+        self.input_map.take()
+        self.drawn_offset = None
 
-            # Rendering
-            for loc, colour in self.area.items():
-                pygame.draw.rect(self.screen, colour, pygame.Rect(loc, (self.grid_size, self.grid_size)))
+    def set_player_colour(self, player_id, colour):
+        self.territory_layer.set_colour(player_id, colour)
+        self.trail_layer.set_colour(player_id, self.render_cache.palette(colour).trail)
+        for minimap in (self.minimap, self.spectator_map):
+            if minimap:
+                minimap.paint(0, 0, minimap.columns, minimap.rows)
+        self.minimap_drawn = None
+        self.drawn_offset = None
+
+    def tick(self):
+        with profiling.profiler.span("tick"):
+            # Bots press their keys just before the tick, through the same buffers as everybody else
+            if self.bots:
+                with profiling.profiler.span("bots"):
+                    for player_id, direction in self.bots.take().items():
+                        self.input_map.pending.setdefault(player_id, []).append(direction)
+
+            # Apply every key pressed since the last tick, in the order they were pressed
+            for player_id, directions in self.input_map.take().items():
+                player = self.world.players.get(player_id)
+                if player is not None:
+                    for direction in directions:
+                        player.steer(direction)
+
+            if self.recorder:
+                self.recorder.step()
+            else:
+                self.world.step()
+            self.sync_snakes()
+
+            # Start on the bots' next move straight away, so a process pool has until the next tick to work it out
+            if self.bots:
+                with profiling.profiler.span("bots"):
+                    self.bots.request()
+
+    def sync_snakes(self):
+        for snake in self.snakes:
+            snake.sync()
+
+        # Players that died were put straight back by the world, give them a new snake
+        for event in self.world.events:
+            if event["type"] == "spawn":
+                player = self.players[event["player"] - 1]
+                snakefile.Snake(self, self.world.players[event["player"]], player["colour"], self.snakes)
+
+    def update_camera(self):
+        # With no one to follow, the camera keeps all the people on screen (not the bots)
+        if self.follow is None:
+            snakes = [snake for snake in self.snakes if self.players[snake.player.id - 1]["controls"] is not None]
+        else:
+            snakes = [snake for snake in self.snakes if snake.player.id == self.follow]
+        if snakes:
+            centres = [snake.display_rect.center for snake in snakes]
+            self.camera.follow((sum(x for x, y in centres) / len(centres), sum(y for x, y in centres) / len(centres)))
+
+    def render(self):
+        profiler = profiling.profiler
+
+        # Maps that aren't on screen still keep up with the board, which is cheap, so showing them again is instant
+        if self.minimap and (self.spectating or not self.show_minimap):
+            self.minimap.update()
+        if self.spectator_map and not self.spectating:
+            self.spectator_map.update()
+
+        if self.spectating:
+            self.render_spectator()
+            return
+
+        with profiler.span("layers"):
+            self.update_camera()
+            camera = self.camera
+            changed = self.territory_layer.update() + self.trail_layer.update()
+
+            # Only the parts of the screen that changed are redrawn, unless the camera moved and everything did
+            screen_rect = self.screen.get_rect()
+            offset = camera.offset
+            if offset != self.drawn_offset:
+                dirty = [screen_rect]
+                self.drawn_offset = offset
+            else:
+                # A cell often changes on both layers and gets drawn over by a snake too, so drop the repeats
+                dirty = [camera.to_screen(rect).clip(screen_rect) for rect in changed if rect.colliderect(camera.rect)] + self.drawn
+                dirty = list({tuple(rect): rect for rect in dirty}.values())
+
+            for rect in dirty:
+                board_rect = camera.to_board(rect)
+                if not camera.board.contains(board_rect):
+                    # Past the edge of a board smaller than the screen
+                    self.screen.fill("black", rect)
+                self.territory_layer.draw(self.screen, board_rect, offset)
+                self.trail_layer.draw(self.screen, board_rect, offset)
+
+        # Snakes off screen aren't drawn at all
+        with profiler.span("snakes"):
+            self.drawn = []
             for snake in self.snakes:
-                snake.draw()
-
-            # draw text
-            for i, player in enumerate(self.players):
-                score = sum(1 for colour in self.area.values() if colour == player["colour"])
-                text = self.font.render(f"{player['display']}: {score}", True, "white")
-                self.screen.blit(text, (0, i * 30))
-
-            # Don't forget to update the screen after rendering
-            pygame.display.update()
-            self.screen.fill("gray")
-            self.clock.tick(self.fps)
-            pygame.display.set_caption("FPS: " + str(int(self.clock.get_fps())))
+                if snake.visible_in(camera.rect):
+                    self.drawn += snake.draw(camera.offset)
+
+        with profiler.span("hud"):
+            self.draw_leaderboard()
+
+        if self.show_minimap:
+            with profiler.span("minimap"):
+                dirty += self.draw_minimap(dirty + self.drawn)
+
+        self.draw_frame_graph()
+
+        # Don't forget to update the screen after rendering
+        pygame.display.update(dirty + self.drawn)
+
+    def draw_leaderboard(self):
+        # draw text, biggest player first
+        for i, entry in enumerate(self.world.leaderboard()[:self.leaderboard_rows]):
+            player = self.players[entry["player"] - 1]
+            text = self.render_cache.text(i, f"{player['display']}: {entry['cells']} ({entry['percent']:.1f}%)")
+            self.drawn.append(self.screen.blit(text, (0, i * 30)))
+
+    def draw_frame_graph(self):
+        if profiling.profiler.enabled:
+            if self.frame_graph is None:
+                self.frame_graph = render.FrameGraph(assets.manager.font('freesansbold.ttf', 14))
+            self.drawn += self.frame_graph.draw(self.screen, profiling.profiler)
+
+    def heads(self):
+        return [(snake.player.head, snake.colour) for snake in self.snakes]
+
+    def draw_minimap(self, dirty):
+        """Draws the minimap in the bottom left corner if anything on it changed or was drawn over it, and returns the
+        rects it drew."""
+        if self.minimap is None:
+            self.minimap = render.Minimap(self.territory_layer, (MINIMAP_SIZE, MINIMAP_SIZE))
+        minimap = self.minimap
+        changed = minimap.update()
+        rect = minimap.surface.get_rect(bottomleft=self.screen.get_rect().bottomleft)
+
+        # Heads only move on a tick and the box only with the camera, so most frames there is nothing to do
+        drawn = (self.world.tick, self.camera.offset)
+        if not changed and drawn == self.minimap_drawn and rect.collidelist(dirty) == -1:
+            return []
+        self.minimap_drawn = drawn
+
+        self.screen.blit(minimap.surface, rect)
+        self.screen.set_clip(rect)
+        minimap.draw_heads(self.screen, rect.topleft, self.heads())
+
+        # Where the camera is looking
+        view = self.camera.rect
+        x0, y0 = minimap.to_map((view.left // self.grid_size, view.top // self.grid_size))
+        x1, y1 = minimap.to_map((-(-view.right // self.grid_size), -(-view.bottom // self.grid_size)))
+        pygame.draw.rect(self.screen, "white", (rect.x + x0, rect.y + y0, max(x1 - x0, 2), max(y1 - y0, 2)), 1)
+        self.screen.set_clip(None)
+        return [rect]
+
+    def render_spectator(self):
+        # The whole board at once, shrunk to fit the screen
+        profiler = profiling.profiler
+        with profiler.span("layers"):
+            # The layers keep following the board, so they are up to date to go back to
+            self.territory_layer.update()
+            self.trail_layer.update()
+
+        with profiler.span("minimap"):
+            screen_rect = self.screen.get_rect()
+            if self.spectator_map is None:
+                self.spectator_map = render.Minimap(self.territory_layer, screen_rect.size)
+            spectator = self.spectator_map
+            changed = spectator.update()
+            rect = spectator.surface.get_rect(center=screen_rect.center)
+
+            if self.drawn_offset is None:
+                dirty = [screen_rect]
+                self.drawn_offset = "spectating"
+            else:
+                dirty = [area.move(rect.topleft) for area in changed] + self.drawn
+
+            # Put the map back everywhere that changed or was drawn over last frame
+            for area in dirty:
+                self.screen.fill("black", area)
+                self.screen.blit(spectator.surface, area.clip(rect), area.clip(rect).move(-rect.x, -rect.y))
+            self.drawn = spectator.draw_heads(self.screen, rect.topleft, self.heads())
+
+        with profiler.span("hud"):
+            self.draw_leaderboard()
+        self.draw_frame_graph()
+        pygame.display.update(dirty + self.drawn)
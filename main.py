@@ -1,39 +1,57 @@
+import os
+
+import assets
 import pygame
 import game
 import menu
 
-pygame.init()
-pygame.font.init()
-
 window_size = (800, 800)
-main_screen = pygame.display.set_mode(window_size)
+
+# Set PAPERIO_SEED to play a seeded match, which is recorded and saved as a replay when it stops (see game.RECORDING)
+seed = int(os.environ["PAPERIO_SEED"]) if os.environ.get("PAPERIO_SEED") else None
 
 
 def main_loop():
+    assets.manager.init()
+    main_screen = pygame.display.set_mode(window_size)
+
+    # The menu's font first, since it's needed straight away, then the game's font can load while the menu is up
+    assets.manager.preload([('freesansbold.ttf', 80), ('freesansbold.ttf', 35)])
+
     active_game = None
-    selected = menu.Menu(main_screen, active_game, menu="main_menu").run()
-    while True:
-        match selected:
-            case "play":
-                active_game = game.Game(main_screen)
-                selected = active_game.run()
-            case "resume":
-                selected = active_game.run()
-            case "quit":
-                pygame.quit()
-                quit()
-
-            # if the button does not return an action case
-            # send button's id to the menu selector
-            case _:
-                selected = menu.Menu(main_screen, active_game, menu=selected).run()
-
-                # Handle invalid menu case
-                if selected is None:
-                    selected = menu.Menu(main_screen, active_game, menu="main_menu").run()
-
-
-main_loop()
+
+    # Quitting (from a menu or the game window) raises SystemExit, so the last game gets closed on the way out too
+    try:
+        selected = menu.Menu(main_screen, active_game, menu="main_menu").run()
+        while True:
+            match selected:
+                case "play":
+                    # The old game's bot workers would otherwise be left running
+                    if active_game:
+                        active_game.close()
+                    active_game = game.Game(main_screen, seed=seed)
+                    selected = active_game.run()
+                case "resume":
+                    selected = active_game.run()
+                case "quit":
+                    pygame.quit()
+                    quit()
+
+                # if the button does not return an action case
+                # send button's id to the menu selector
+                case _:
+                    selected = menu.Menu(main_screen, active_game, menu=selected).run()
+
+                    # Handle invalid menu case
+                    if selected is None:
+                        selected = menu.Menu(main_screen, active_game, menu="main_menu").run()
+    finally:
+        if active_game:
+            active_game.close()
+
+
+if __name__ == "__main__":
+    main_loop()
 
 # Install pyinstaller command:
 # pip install pyinstaller
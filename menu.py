@@ -1,12 +1,12 @@
 import asyncio
 import pygame
 
+import assets
+
 
 class Button:
     def __init__(self, screen, x, y, height, width, border, curve, buttonColour, textColour, hoverColour, id, text):
-        pygame.init()
-        pygame.font.init()
-        self.font = pygame.font.Font('freesansbold.ttf', 80)
+        self.font = assets.manager.font('freesansbold.ttf', 80)
 
         self.screen = screen
         self.x = x
@@ -22,6 +22,10 @@ class Button:
         self.text = text
         self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
 
+        # The label is only rendered again if the text changes
+        self.label = None
+        self.label_text = None
+
         self.highlighted = False
 
     def update(self, event):
@@ -42,9 +46,11 @@ class Button:
             pygame.draw.rect(self.screen, self.buttonColour, (self.x, self.y, self.width, self.height), self.border, self.curve)
 
         if self.text != "":
-            text_surf = self.font.render(self.text, True, self.textColour)
-            text_rect = text_surf.get_rect(center=(self.x + self.width // 2, self.y + self.height // 2))
-            self.screen.blit(text_surf, text_rect)
+            if self.label_text != self.text:
+                self.label = self.font.render(self.text, True, self.textColour)
+                self.label_text = self.text
+            text_rect = self.label.get_rect(center=(self.x + self.width // 2, self.y + self.height // 2))
+            self.screen.blit(self.label, text_rect)
 
 
 class Menu:
@@ -87,6 +93,7 @@ class Menu:
                 button.draw()
 
             pygame.display.update()
+            assets.manager.mark_interactive()
             self.screen.fill((60, 60, 60))
             self.clock.tick(self.fps)
             pygame.display.set_caption("FPS: " + str(int(self.clock.get_fps())))
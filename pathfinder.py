@@ -0,0 +1,116 @@
+from collections import deque
+
+# Shortest paths through a player's own area, used to close a trail into an outline when it gets home.
+# Cells are flat y * width + x indices so the search can run straight off Territory.owned without building anything.
+# Each cell visited remembers the cell it was reached from, and the path is only walked back once the end is found.
+
+# Above this many cells to search through, search from both ends at once
+BIDIRECTIONAL_CELLS = 4096
+
+
+def neighbours(cell, width, size):
+    # Same order as the original search: left, right, up, down
+    x = cell % width
+    if x > 0:
+        yield cell - 1
+    if x < width - 1:
+        yield cell + 1
+    if cell >= width:
+        yield cell - width
+    if cell + width < size:
+        yield cell + width
+
+
+def walk_back(parents, cell):
+    path = []
+    while cell is not None:
+        path.append(cell)
+        cell = parents[cell]
+    return path
+
+
+def in_bounds(cell, width, bounds):
+    x0, y0, x1, y1 = bounds
+    return x0 <= cell % width < x1 and y0 <= cell // width < y1
+
+
+def search(cells, width, height, start, end):
+    size = width * height
+    parents = {start: None}
+    queue = deque([start])
+
+    while queue:
+        cell = queue.popleft()
+        if cell == end:
+            return walk_back(parents, cell)[::-1]
+
+        for nxt in neighbours(cell, width, size):
+            if nxt not in parents and nxt in cells:
+                parents[nxt] = cell
+                queue.append(nxt)
+
+    return []
+
+
+def bidirectional_search(cells, width, height, start, end):
+    if start == end:
+        return [start]
+
+    size = width * height
+    sides = [({start: None}, [start]), ({end: None}, [end])]
+
+    while sides[0][1] and sides[1][1]:
+        # Grow whichever side has the smaller frontier by one full level
+        side = 0 if len(sides[0][1]) <= len(sides[1][1]) else 1
+        parents, frontier = sides[side]
+        others = sides[1 - side][0]
+        next_frontier = []
+
+        for cell in frontier:
+            for nxt in neighbours(cell, width, size):
+                if nxt in parents or nxt not in cells:
+                    continue
+                parents[nxt] = cell
+                if nxt in others:
+                    # The two searches met, join the two halves at nxt
+                    return walk_back(sides[0][0], nxt)[::-1] + walk_back(sides[1][0], nxt)[1:]
+                next_frontier.append(nxt)
+
+        sides[side] = (parents, next_frontier)
+
+    return []
+
+
+def shortest_path(cells, width, height, start, end, bounds=None, bidirectional=None):
+    """Returns the flat cells of a shortest path from start to end moving only through cells, or [] if there is none.
+
+    bounds is an optional (x0, y0, x1, y1) box, x1 and y1 exclusive, that the path has to stay inside.
+    bidirectional defaults to searching from both ends when there are more than BIDIRECTIONAL_CELLS cells.
+    """
+    if bounds is not None:
+        allowed = cells
+        cells = _BoundedCells(allowed, width, bounds)
+        if start != end and not in_bounds(end, width, bounds):
+            return []
+
+    if bidirectional is None:
+        bidirectional = len(cells) > BIDIRECTIONAL_CELLS
+
+    if bidirectional:
+        return bidirectional_search(cells, width, height, start, end)
+    return search(cells, width, height, start, end)
+
+
+class _BoundedCells:
+    # Looks like the set of cells to the searches, but only has the ones inside bounds
+    def __init__(self, cells, width, bounds):
+        self.cells = cells
+        self.width = width
+        self.bounds = bounds
+
+    def __contains__(self, cell):
+        return cell in self.cells and in_bounds(cell, self.width, self.bounds)
+
+    def __len__(self):
+        x0, y0, x1, y1 = self.bounds
+        return min(len(self.cells), max(x1 - x0, 0) * max(y1 - y0, 0))
@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Timing spans around the hot paths (input, ticks, capture, collisions, drawing), switched on and off while the game
+# runs. When they are off a span is one attribute check, so they can stay in the code for good.
+#   with profiling.profiler.span("capture"):
+#       ...
+# They feed the frame-time graph (render.FrameGraph) and can be saved as a Chrome trace (chrome://tracing or
+# https://ui.perfetto.dev). Set PAPERIO_PROFILE=1 to start with them on. No pygame here, so the world can use it.
+
+# Spans kept for a trace, the oldest are dropped after this
+MAX_SPANS = 200000
+
+# Frames kept for the graph
+MAX_FRAMES = 240
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = bool(os.environ.get("PAPERIO_PROFILE"))
+
+        # (name, start ns, duration ns, thread id) of every span, for the trace
+        self.spans = deque(maxlen=MAX_SPANS)
+
+        # (frame ms, {span name: ms spent in it during the frame}) for the graph
+        self.frames = deque(maxlen=MAX_FRAMES)
+        self.frame_count = 0
+        self.current = {}
+        self.frame_start = time.perf_counter_ns()
+
+        # The simulation thread records spans too
+        self.lock = threading.Lock()
+
+    def span(self, name):
+        return Span(self, name) if self.enabled else NO_SPAN
+
+    def record(self, name, start, end):
+        with self.lock:
+            self.spans.append((name, start, end - start, threading.get_ident()))
+            self.current[name] = self.current.get(name, 0) + end - start
+
+    def toggle(self):
+        # Every time they're turned on is a new trace
+        self.enabled = not self.enabled
+        if self.enabled:
+            self.spans.clear()
+        self.frames.clear()
+        self.current = {}
+        self.begin_frame()
+        return self.enabled
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter_ns()
+
+    def end_frame(self):
+        """Closes the frame's numbers off for the graph. Frame time is the work done since begin_frame, not counting
+        the wait for the next frame."""
+        if not self.enabled:
+            return
+        with self.lock:
+            phases = {name: ns / 1e6 for name, ns in self.current.items()}
+            self.current = {}
+        self.frames.append(((time.perf_counter_ns() - self.frame_start) / 1e6, phases))
+        self.frame_count += 1
+
+    def chrome_trace(self):
+        """Every span kept, as Chrome trace-event JSON (complete "X" events, in microseconds)."""
+        with self.lock:
+            spans = list(self.spans)
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {"name": name, "ph": "X", "ts": start / 1000, "dur": duration / 1000, "pid": pid, "tid": thread}
+                for name, start, duration, thread in spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def export(self, path=None):
+        if path is None:
+            path = time.strftime("paperio-trace-%Y%m%d-%H%M%S.json")
+        with open(path, "w") as file:
+            json.dump(self.chrome_trace(), file)
+        return path
+
+
+profiler = Profiler()
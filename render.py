@@ -0,0 +1,328 @@
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+
+# Changes smaller than this are painted cell by cell, bigger ones are painted as one block with numpy
+BLOCK_PAINT_CELLS = 64
+
+# Layers without a background are see-through wherever they are this colour. Trail colours are lightened, so they
+# never get this dark.
+TRANSPARENT = (0, 0, 0)
+
+# A layer is painted in square tiles of about this many pixels, and only the tiles that have been on screen are kept.
+# That way a layer of a huge arena only costs as much as the part of it that is being looked at.
+TILE_PIXELS = 256
+MAX_TILES = 96
+
+# The minimap is repainted in square tiles of this many of its pixels, only where an owner changed
+MINIMAP_TILE = 32
+
+# Phases stacked up in the frame-time graph, in the order they happen. None of them run inside one another.
+GRAPH_PHASES = {"events": "orange", "tick": "red", "layers": "green", "snakes": "deepskyblue", "hud": "violet", "minimap": "gold"}
+GRAPH_MS = 40
+BUDGET_MS = 1000 / 60
+
+
+class CellLayer:
+    """A grid of owners painted in tiles (the territory, or the trails), kept up to date by only repainting cells that
+    change owner. cells is anything with a grid (a ChunkedGrid), width, height and listeners.
+
+    Positions and rects are in board pixels, cell (x, y) being at (x * grid_size, y * grid_size).
+    """
+
+    def __init__(self, cells, grid_size, colours, background="gray"):
+        self.cells = cells
+        self.grid_size = grid_size
+        self.tile_cells = max(1, TILE_PIXELS // grid_size)
+        self.tile_size = self.tile_cells * grid_size
+        self.bounds = pygame.Rect(0, 0, cells.width * grid_size, cells.height * grid_size)
+        self.transparent = background is None
+        if self.transparent:
+            background = TRANSPARENT
+
+        # palette[owner] is the RGB colour for that owner, 0 being the empty background
+        self.palette = np.zeros((1, 3), dtype=np.uint8)
+        self.set_colour(0, background)
+        for owner, colour in colours.items():
+            self.set_colour(owner, colour)
+
+        # (tile x, tile y) -> painted surface, least recently drawn first
+        self.tiles = OrderedDict()
+
+        self.pending = []
+        cells.listeners.append(self.pending.append)
+
+    def set_colour(self, owner, colour):
+        if owner >= len(self.palette):
+            palette = np.zeros((owner + 1, 3), dtype=np.uint8)
+            palette[:len(self.palette)] = self.palette
+            self.palette = palette
+        self.palette[owner] = tuple(pygame.Color(colour))[:3]
+
+    def cell_rect(self, x, y):
+        return pygame.Rect(x * self.grid_size, y * self.grid_size, self.grid_size, self.grid_size)
+
+    def tile(self, tx, ty):
+        """Returns the surface for a tile, painting it if it isn't cached."""
+        surface = self.tiles.get((tx, ty))
+        if surface is not None:
+            self.tiles.move_to_end((tx, ty))
+            return surface
+
+        x0, y0 = tx * self.tile_cells, ty * self.tile_cells
+        x1, y1 = min(x0 + self.tile_cells, self.cells.width), min(y0 + self.tile_cells, self.cells.height)
+        surface = pygame.Surface(((x1 - x0) * self.grid_size, (y1 - y0) * self.grid_size))
+        if self.transparent:
+            surface.set_colorkey(TRANSPARENT)
+        self.tiles[(tx, ty)] = surface
+        self.paint_block(surface, x0, y0, x0, y0, x1, y1)
+
+        if len(self.tiles) > MAX_TILES:
+            self.tiles.popitem(last=False)
+        return surface
+
+    def paint_block(self, surface, origin_x, origin_y, x0, y0, x1, y1):
+        # Look every cell in the block up in the palette, then scale each cell up to grid_size pixels.
+        # origin is the cell at the top left of surface.
+        pixels = self.palette[self.cells.grid.read(x0, y0, x1, y1)]
+        pixels = pixels.repeat(self.grid_size, axis=0).repeat(self.grid_size, axis=1)
+        rect = pygame.Rect((x0 - origin_x) * self.grid_size, (y0 - origin_y) * self.grid_size, pixels.shape[1], pixels.shape[0])
+        # surfarray wants [x, y] ordering
+        pygame.surfarray.blit_array(surface.subsurface(rect), pixels.swapaxes(0, 1))
+
+    def update(self):
+        """Repaints every cell that changed since the last call and returns the rects of the board that changed.
+        Tiles that aren't cached aren't painted, they get painted fresh the next time they are drawn."""
+        if not self.pending:
+            return []
+
+        flat = np.unique(np.concatenate(self.pending))
+        self.pending.clear()
+        xs, ys = flat % self.cells.width, flat // self.cells.width
+
+        if len(flat) < BLOCK_PAINT_CELLS:
+            dirty = []
+            owners = self.cells.grid.take(flat)
+            for x, y, owner in zip(xs.tolist(), ys.tolist(), owners.tolist()):
+                rect = self.cell_rect(x, y)
+                dirty.append(rect)
+                tx, ty = x // self.tile_cells, y // self.tile_cells
+                surface = self.tiles.get((tx, ty))
+                if surface is not None:
+                    surface.fill(self.palette[owner], rect.move(-tx * self.tile_size, -ty * self.tile_size))
+            return dirty
+
+        # Repaint the box around the changes in each tile. Tiles are done separately so changes far apart on a big
+        # board don't turn into one huge box.
+        tiles = (ys // self.tile_cells) * (self.cells.width // self.tile_cells + 1) + xs // self.tile_cells
+        order = np.argsort(tiles, kind="stable")
+        tiles, xs, ys = tiles[order], xs[order], ys[order]
+        starts = np.flatnonzero(np.concatenate(([True], tiles[1:] != tiles[:-1])))
+        boxes = zip(xs[starts].tolist(), ys[starts].tolist(), np.minimum.reduceat(xs, starts).tolist(), np.minimum.reduceat(ys, starts).tolist(),
+                    (np.maximum.reduceat(xs, starts) + 1).tolist(), (np.maximum.reduceat(ys, starts) + 1).tolist())
+
+        dirty = []
+        for x, y, x0, y0, x1, y1 in boxes:
+            tx, ty = x // self.tile_cells, y // self.tile_cells
+            surface = self.tiles.get((tx, ty))
+            if surface is not None:
+                self.paint_block(surface, tx * self.tile_cells, ty * self.tile_cells, x0, y0, x1, y1)
+            dirty.append(pygame.Rect(x0 * self.grid_size, y0 * self.grid_size, (x1 - x0) * self.grid_size, (y1 - y0) * self.grid_size))
+        return dirty
+
+    def draw(self, screen, rect, offset):
+        """Draws the part of the layer inside rect (in board pixels) onto screen, where offset is the board pixel at
+        the top left of the screen. Only the tiles rect touches are looked at."""
+        rect = rect.clip(self.bounds)
+        if not rect:
+            return
+
+        size = self.tile_size
+        left, top, right, bottom = rect.left // size, rect.top // size, (rect.right - 1) // size, (rect.bottom - 1) // size
+        for ty in range(top, bottom + 1):
+            for tx in range(left, right + 1):
+                area = rect if left == right and top == bottom else rect.clip(tx * size, ty * size, size, size)
+                screen.blit(self.tile(tx, ty), (area.x - offset[0], area.y - offset[1]), area.move(-tx * size, -ty * size))
+
+
+class Camera:
+    """The part of the board that is on screen, in board pixels. The board can be any size, the camera just follows
+    a point around on it and never shows past its edges (unless the board is smaller than the screen)."""
+
+    def __init__(self, view_size, board_size):
+        self.rect = pygame.Rect((0, 0), view_size)
+        self.board = pygame.Rect((0, 0), board_size)
+
+    @property
+    def offset(self):
+        return self.rect.topleft
+
+    def follow(self, position):
+        self.rect.center = (round(position[0]), round(position[1]))
+        # clamp_ip centres the camera on the board when the board is the smaller of the two
+        self.rect.clamp_ip(self.board)
+
+    def to_screen(self, rect):
+        return rect.move(-self.rect.x, -self.rect.y)
+
+    def to_board(self, rect):
+        return rect.move(self.rect.x, self.rect.y)
+
+
+def row_modes(values):
+    """Returns the most common value in each row of a 2d array, the smallest of them on a tie."""
+    values = np.sort(values, axis=1)
+    positions = np.arange(values.shape[1])
+
+    # How long the run of equal values is so far at every position, the longest run ends where that is biggest
+    starts = np.ones(values.shape, dtype=bool)
+    starts[:, 1:] = values[:, 1:] != values[:, :-1]
+    run = positions - np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+    return values[np.arange(len(values)), run.argmax(axis=1)]
+
+
+class Minimap:
+    """The whole territory shrunk down to fit in size pixels, for the minimap and the spectator view. Every pixel
+    shows whoever owns most of the square of cells under it (scale x scale of them), or every cell is zoom x zoom
+    pixels if the board is smaller than size. Colours come from layer, the territory's CellLayer.
+
+    It follows the same change events as the layers do. Only pixels with a changed cell under them are worked out again,
+    and only the tiles of the surface where one of those pixels changed are repainted.
+    """
+
+    def __init__(self, layer, size):
+        self.layer = layer
+        self.cells = layer.cells
+        width, height = self.cells.width, self.cells.height
+        self.scale = max(1, -(-width // size[0]), -(-height // size[1]))
+        self.zoom = max(1, min(size[0] // width, size[1] // height))
+
+        # owners[y, x] is the owner shown by pixel (x, y), before zooming
+        self.columns, self.rows = -(-width // self.scale), -(-height // self.scale)
+        self.owners = np.zeros((self.rows, self.columns), dtype=np.uint16)
+        self.surface = pygame.Surface((self.columns * self.zoom, self.rows * self.zoom))
+
+        # Every cell of the board is worked out once to start with, a band of tiles at a time
+        band = MINIMAP_TILE * self.scale
+        for y0 in range(0, height, band):
+            block = self.cells.grid.read(0, y0, width, min(y0 + band, height))
+            # Pad out to whole pixels by repeating the last row and column of cells
+            block = np.pad(block, ((0, -block.shape[0] % self.scale), (0, -block.shape[1] % self.scale)), mode="edge")
+            rows = block.shape[0] // self.scale
+            pixels = block.reshape(rows, self.scale, self.columns, self.scale).swapaxes(1, 2).reshape(rows * self.columns, -1)
+            self.owners[y0 // self.scale:y0 // self.scale + rows] = row_modes(pixels).reshape(rows, self.columns)
+        self.paint(0, 0, self.columns, self.rows)
+
+        self.pending = []
+        self.cells.listeners.append(self.pending.append)
+
+    def paint(self, x0, y0, x1, y1):
+        # Pixels x0 <= x < x1, y0 <= y < y1 of owners onto the surface
+        pixels = self.layer.palette[self.owners[y0:y1, x0:x1]]
+        pixels = pixels.repeat(self.zoom, axis=0).repeat(self.zoom, axis=1)
+        rect = pygame.Rect(x0 * self.zoom, y0 * self.zoom, pixels.shape[1], pixels.shape[0])
+        pygame.surfarray.blit_array(self.surface.subsurface(rect), pixels.swapaxes(0, 1))
+        return rect
+
+    def update(self):
+        """Works out every pixel with a changed cell under it, repaints the tiles where one changed, and returns the
+        rects of the surface that were repainted."""
+        if not self.pending:
+            return []
+
+        width, height = self.cells.width, self.cells.height
+        flat = np.concatenate(self.pending)
+        self.pending.clear()
+        pixels = np.unique(flat // width // self.scale * self.columns + flat % width // self.scale)
+        ys, xs = pixels // self.columns, pixels % self.columns
+
+        # Every cell under every one of those pixels, cells past the edge standing in for the last ones on the board
+        dy, dx = np.divmod(np.arange(self.scale * self.scale), self.scale)
+        cell_x = np.minimum(xs[:, None] * self.scale + dx, width - 1)
+        cell_y = np.minimum(ys[:, None] * self.scale + dy, height - 1)
+        owners = row_modes(self.cells.grid.take((cell_y * width + cell_x).ravel()).reshape(len(pixels), -1))
+
+        changed = owners != self.owners[ys, xs]
+        if not changed.any():
+            return []
+        ys, xs = ys[changed], xs[changed]
+        self.owners[ys, xs] = owners[changed]
+
+        repainted = []
+        for tile in np.unique(ys // MINIMAP_TILE * (self.columns // MINIMAP_TILE + 1) + xs // MINIMAP_TILE).tolist():
+            ty, tx = divmod(tile, self.columns // MINIMAP_TILE + 1)
+            x0, y0 = tx * MINIMAP_TILE, ty * MINIMAP_TILE
+            repainted.append(self.paint(x0, y0, min(x0 + MINIMAP_TILE, self.columns), min(y0 + MINIMAP_TILE, self.rows)))
+        return repainted
+
+    def to_map(self, cell):
+        """The pixel of the surface a board cell is shown at."""
+        return cell[0] // self.scale * self.zoom, cell[1] // self.scale * self.zoom
+
+    def draw_heads(self, screen, topleft, heads):
+        """Draws a dot for every (cell, colour) in heads, with the surface's top left at topleft on screen, and returns
+        the rects drawn over."""
+        size = max(4, self.zoom)
+        drawn = []
+        for cell, colour in heads:
+            x, y = self.to_map(cell)
+            rect = pygame.Rect(0, 0, size, size)
+            rect.center = (topleft[0] + x + self.zoom // 2, topleft[1] + y + self.zoom // 2)
+            drawn.append(screen.fill("black", rect))
+            screen.fill(colour, rect.inflate(-2, -2))
+        return drawn
+
+
+class FrameGraph:
+    """A graph of how long the last frames took, one column of pixels per frame with each phase stacked in its colour
+    and whatever else the frame did in grey. The line is the time a frame has at 60 fps."""
+
+    def __init__(self, font, size=(240, 100)):
+        self.font = font
+        self.surface = pygame.Surface(size)
+        self.surface.fill("black")
+        self.drawn_count = 0
+
+    def column(self, x, frame_ms, phases):
+        height = self.surface.get_height()
+        scale = height / GRAPH_MS
+        self.surface.fill("black", (x, 0, 1, height))
+        self.surface.fill("gray40", (x, height - min(frame_ms * scale, height), 1, height))
+        bottom = height
+        for name, colour in GRAPH_PHASES.items():
+            size = phases.get(name, 0) * scale
+            if size:
+                self.surface.fill(colour, (x, bottom - size, 1, size))
+                bottom -= size
+
+    def draw(self, screen, profiler):
+        """Draws the graph in the bottom right corner and returns the rects drawn over."""
+        frames = profiler.frames
+        width, height = self.surface.get_size()
+
+        # Only the frames that came in since the last draw are added, the rest is scrolled along
+        new = min(profiler.frame_count - self.drawn_count, width, len(frames))
+        self.drawn_count = profiler.frame_count
+        if new:
+            self.surface.scroll(-new, 0)
+            for i, (frame_ms, phases) in enumerate(list(frames)[-new:]):
+                self.column(width - new + i, frame_ms, phases)
+
+        rect = self.surface.get_rect(bottomright=screen.get_rect().bottomright)
+        screen.blit(self.surface, rect)
+        budget = rect.bottom - BUDGET_MS * height / GRAPH_MS
+        pygame.draw.line(screen, "white", (rect.left, budget), (rect.right - 1, budget))
+        drawn = [rect]
+
+        if frames:
+            frame_ms, phases = frames[-1]
+            worst = max(ms for ms, _ in frames)
+            slowest = sorted(phases.items(), key=lambda item: -item[1])[:3]
+            lines = [f"frame {frame_ms:.1f} ms, worst {worst:.1f} ms"] + [f"{name} {ms:.2f} ms" for name, ms in slowest]
+            y = rect.top
+            for line in reversed(lines):
+                text = self.font.render(line, True, "white", "black")
+                y -= text.get_height()
+                drawn.append(screen.blit(text, (rect.left, y)))
+        return drawn
@@ -0,0 +1,161 @@
+import struct
+
+import capture
+import world
+
+# A seeded match is decided entirely by its seed and the direction changes players make, so that is all a recording
+# keeps. The file is a header followed by records of two varints each:
+#   ticks since the last record, then player_id << 2 | direction    a player changed direction
+#   ticks since the last record, then 0, then a 4 byte state hash     a checkpoint to check a replay against
+#   ticks since the last record, then 1                               the end of the match
+# which comes to two or three bytes for most direction changes.
+
+MAGIC = b"PIOL"
+VERSION = 3
+HEADER = struct.Struct("<4sBHHqBH")  # magic, version, width, height, seed, capture engine, number of players
+PLAYER_ID = struct.Struct("<H")
+CHECKSUM = struct.Struct("<I")
+
+CHECKPOINT = 0
+END = 1
+
+ENGINE_NAMES = list(capture.ENGINES)
+
+
+class ReplayError(Exception):
+    pass
+
+
+def write_varint(out, value):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class Recorder:
+    """Records a seeded world. Call step() instead of world.step() and the direction changes get logged."""
+
+    def __init__(self, match, checkpoint_every=60):
+        if match.seed is None or match.tick != 0:
+            raise ReplayError("Only a seeded match can be recorded, from its first tick")
+
+        self.world = match
+        self.checkpoint_every = checkpoint_every
+        self.seed = match.seed
+        self.engine = ENGINE_NAMES.index(capture.engine_name(match.capture_engine))
+        self.records = bytearray()
+        self.last_tick = 0
+
+        # The input direction each player had when it was last recorded. Keyed by player id, but holding the player
+        # too so a respawned player starts from scratch.
+        self.recorded = {}
+
+    def add_record(self, code):
+        write_varint(self.records, self.world.tick - self.last_tick)
+        write_varint(self.records, code)
+        self.last_tick = self.world.tick
+
+    def step(self, inputs=None):
+        # Whatever players turned to since the last tick (through steer or inputs) is what gets written down
+        if inputs:
+            for player_id, direction in inputs.items():
+                if player_id in self.world.players:
+                    self.world.players[player_id].steer(direction)
+
+        for player in self.world.players.values():
+            last = self.recorded.get(player.id)
+            if last is None or last[0] is not player:
+                last = (player, None)
+            if player.input_direction is not None and player.input_direction != last[1]:
+                self.add_record(player.id << 2 | world.DIRECTION_NAMES.index(player.input_direction))
+            self.recorded[player.id] = (player, player.input_direction)
+
+        self.world.step()
+
+        if self.checkpoint_every and self.world.tick % self.checkpoint_every == 0:
+            self.add_record(CHECKPOINT)
+            self.records += CHECKSUM.pack(self.world.state_hash())
+
+    def to_bytes(self):
+        header = HEADER.pack(MAGIC, VERSION, self.world.width, self.world.height, self.seed, self.engine, len(self.world.roster))
+        players = b"".join(PLAYER_ID.pack(player_id) for player_id in self.world.roster)
+        end = bytearray()
+        write_varint(end, self.world.tick - self.last_tick)
+        write_varint(end, END)
+        return header + players + bytes(self.records) + bytes(end)
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(self.to_bytes())
+
+
+class Replay:
+    """Plays a recording back headless, as fast as the CPU allows."""
+
+    def __init__(self, data):
+        if isinstance(data, str):
+            with open(data, "rb") as file:
+                data = file.read()
+
+        magic, version, self.width, self.height, self.seed, engine, players = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ReplayError("Not a recording this version can play")
+        self.capture_engine = ENGINE_NAMES[engine]
+        offset = HEADER.size
+        self.roster = [PLAYER_ID.unpack_from(data, offset + i * PLAYER_ID.size)[0] for i in range(players)]
+        offset += players * PLAYER_ID.size
+
+        # inputs[tick] are the direction changes to apply before that tick, checkpoints[tick] the hash after it
+        self.inputs = {}
+        self.checkpoints = {}
+        tick = 0
+        while True:
+            delta, offset = read_varint(data, offset)
+            code, offset = read_varint(data, offset)
+            tick += delta
+            if code == END:
+                break
+            if code == CHECKPOINT:
+                self.checkpoints[tick] = CHECKSUM.unpack_from(data, offset)[0]
+                offset += CHECKSUM.size
+            else:
+                self.inputs.setdefault(tick, {})[code >> 2] = world.DIRECTION_NAMES[code & 3]
+        self.length = tick
+
+        self.world = None
+        self.restart()
+
+    def restart(self):
+        self.world = world.World(self.width, self.height, self.seed, self.capture_engine)
+        for player_id in self.roster:
+            self.world.join(player_id)
+
+    def step(self, verify=True):
+        self.world.step(self.inputs.get(self.world.tick))
+        expected = self.checkpoints.get(self.world.tick)
+        if verify and expected is not None and expected != self.world.state_hash():
+            raise ReplayError(f"Replay went out of sync at tick {self.world.tick}")
+
+    def seek(self, tick, verify=True):
+        """Plays the match up to tick, starting over if that is behind where the replay is now."""
+        tick = min(tick, self.length)
+        if tick < self.world.tick:
+            self.restart()
+        while self.world.tick < tick:
+            self.step(verify)
+        return self.world
+
+    def run(self, verify=True):
+        return self.seek(self.length, verify)
@@ -0,0 +1,49 @@
+import pygame
+
+# Things the draw code would otherwise build from scratch every frame: text surfaces, colours and cell sized tiles.
+
+
+def lighten_colour(colour, amount):
+    colour = pygame.Color(colour)
+    colour.r = min(255, colour.r + amount)
+    colour.g = min(255, colour.g + amount)
+    colour.b = min(255, colour.b + amount)
+    return colour
+
+
+class Palette:
+    """A player's colours, worked out once, and tiles of those colours the size of a cell ready to blit."""
+
+    def __init__(self, colour, grid_size):
+        self.colour = pygame.Color(colour)
+        self.trail = lighten_colour(self.colour, 35)
+
+        self.tile = pygame.Surface((grid_size, grid_size))
+        self.tile.fill(self.colour)
+        self.trail_tile = pygame.Surface((grid_size, grid_size))
+        self.trail_tile.fill(self.trail)
+
+
+class RenderCache:
+    def __init__(self, font, grid_size):
+        self.font = font
+        self.grid_size = grid_size
+
+        # slot -> (text, colour, surface). Each line of text on screen has its own slot and is only rendered again
+        # when what it says changes.
+        self.lines = {}
+        self.palettes = {}
+
+    def text(self, slot, text, colour="white"):
+        line = self.lines.get(slot)
+        if line is None or line[0] != text or line[1] != colour:
+            line = (text, colour, self.font.render(text, True, colour))
+            self.lines[slot] = line
+        return line[2]
+
+    def palette(self, colour):
+        key = tuple(pygame.Color(colour))
+        palette = self.palettes.get(key)
+        if palette is None:
+            palette = self.palettes[key] = Palette(colour, self.grid_size)
+        return palette
@@ -0,0 +1,460 @@
+import argparse
+import asyncio
+import random
+import struct
+import sys
+import time
+
+import numpy as np
+
+import chunks
+import snapshot
+import world
+from replay import read_varint, write_varint
+from territory import Territory
+
+# An authoritative server: the world only ever steps here, clients send the directions they want to turn and get back
+# what changed. Every message is a 4 byte length followed by that many bytes, the first of which says what it is:
+#   WELCOME   server -> client   varints: player id, board width, board height
+#   SNAPSHOT  server -> client   the whole state, see encode_state
+#   DELTA     server -> client   only what changed in the last tick, in the same layout as a snapshot
+#   INPUT     client -> server   one byte, the index of a direction in world.DIRECTIONS
+# A delta is encoded once per tick and the same bytes go to every client, so a tick costs the same however many
+# clients there are. A client that can't keep up stops getting deltas and is sent a snapshot once it has caught up.
+#
+#   python server.py --port 5555                   serve forever
+#   python server.py --clients 32 --ticks 300      run with loopback clients and report bandwidth and latency
+#   python server.py --save match.pios             save the match every few seconds and on shutdown
+#   python server.py --load match.pios             carry on a saved match, after a crash or on another machine
+
+FRAME = struct.Struct("!I")
+
+WELCOME = 0
+SNAPSHOT = 1
+DELTA = 2
+INPUT = 3
+
+# Clients only ever send single directions, anything bigger than this is a broken or hostile client
+MAX_CLIENT_FRAME = 16
+
+# Directions a client can queue up for one tick, the rest are dropped
+MAX_PENDING_INPUTS = 4
+
+# Bytes waiting to go out to a client before it counts as too slow for deltas
+MAX_BUFFER = 256 * 1024
+
+DRAWING = 1
+
+# Ticks to remember the send time of
+SENT_HISTORY = 100
+
+# Ticks players of a loaded match wait for somebody to connect and take them over, before they are removed
+HANDOFF_TICKS = 100
+
+
+def frame(payload):
+    return FRAME.pack(len(payload)) + payload
+
+
+async def read_frame(reader, limit=None):
+    (length,) = FRAME.unpack(await reader.readexactly(FRAME.size))
+    if limit is not None and length > limit:
+        raise ConnectionError(f"Frame of {length} bytes is over the limit of {limit}")
+    return await reader.readexactly(length)
+
+
+def write_cells(out, flat, values):
+    # flat is sorted. Runs of neighbouring cells with the same value (a captured row, a freed area) go as one
+    # (gap since the end of the last run, length, value), which is what keeps big changes small.
+    if not len(flat):
+        write_varint(out, 0)
+        return
+    breaks = np.flatnonzero((np.diff(flat) != 1) | (np.diff(values) != 0)) + 1
+    starts = np.concatenate(([0], breaks)).tolist()
+    ends = np.concatenate((breaks, [len(flat)])).tolist()
+    flat, values = flat.tolist(), values.tolist()
+
+    write_varint(out, len(starts))
+    previous = 0
+    for start, end in zip(starts, ends):
+        write_varint(out, flat[start] - previous)
+        write_varint(out, end - start)
+        write_varint(out, values[start])
+        previous = flat[end - 1] + 1
+
+
+def read_cells(data, offset):
+    """Returns a list of (first flat cell, number of cells, value) runs and the offset after them."""
+    runs = []
+    count, offset = read_varint(data, offset)
+    previous = 0
+    for _ in range(count):
+        gap, offset = read_varint(data, offset)
+        length, offset = read_varint(data, offset)
+        value, offset = read_varint(data, offset)
+        runs.append((previous + gap, length, value))
+        previous += gap + length
+    return runs, offset
+
+
+def runs_by_value(runs):
+    # One array of flat cells per value, so a message is applied with one write per owner rather than one per run
+    cells = {}
+    for start, length, value in runs:
+        cells.setdefault(value, []).append(np.arange(start, start + length))
+    return {value: np.concatenate(parts) for value, parts in cells.items()}
+
+
+def encode_state(kind, tick, cells, trails, heads, gone):
+    """cells and trails are (sorted flat cells, values) pairs, heads maps a player id to (x, y, flags) and gone lists
+    the players that are no longer on the board."""
+    out = bytearray([kind])
+    write_varint(out, tick)
+    write_cells(out, *cells)
+    write_cells(out, *trails)
+    write_varint(out, len(heads))
+    for player_id, (x, y, flags) in heads.items():
+        for value in (player_id, x, y, flags):
+            write_varint(out, value)
+    write_varint(out, len(gone))
+    for player_id in gone:
+        write_varint(out, player_id)
+    return bytes(out)
+
+
+class Connection:
+    def __init__(self, player_id, writer):
+        self.player_id = player_id
+        self.writer = writer
+        self.inputs = []
+        self.needs_snapshot = True
+
+    def send(self, payload):
+        self.writer.write(frame(payload))
+
+    @property
+    def behind(self):
+        return self.writer.transport.get_write_buffer_size() > MAX_BUFFER
+
+
+class Server:
+    def __init__(self, match, tick_ms=140, max_clients=64, save_path=None, save_every=100):
+        self.world = match
+        self.tick_ms = tick_ms
+        self.max_clients = max_clients
+
+        # With save_path the match is saved every save_every ticks and when the server closes, see snapshot.py
+        self.save_path = save_path
+        self.save_every = save_every
+
+        # A match loaded from a snapshot comes with players nobody is connected as yet. New clients take them over
+        # first, and any left after HANDOFF_TICKS are removed.
+        self.orphans = sorted(match.roster)
+        self.orphans_until = match.tick + HANDOFF_TICKS
+        self.connections = {}
+        self.handlers = set()
+        self.server = None
+
+        # Every cell that changed hands or trail since the last delta, straight from the world's listeners
+        self.changed_cells = []
+        self.changed_trails = []
+        match.territory.listeners.append(self.changed_cells.append)
+        match.trails.listeners.append(self.changed_trails.append)
+
+        # The heads every client was last told about
+        self.heads = {}
+
+        # When each tick's delta went out, for measuring latency on loopback
+        self.sent = {}
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    def free_id(self):
+        taken = set(self.world.roster).union(self.world.players, self.world.territory.owned)
+        player_id = 1
+        while player_id in taken:
+            player_id += 1
+        return player_id
+
+    async def handle(self, reader, writer):
+        if len(self.connections) >= self.max_clients:
+            writer.close()
+            return
+
+        self.handlers.add(asyncio.current_task())
+        if self.orphans:
+            player_id = self.orphans.pop(0)
+        else:
+            player_id = self.free_id()
+            self.world.join(player_id)
+        connection = self.connections[player_id] = Connection(player_id, writer)
+        welcome = bytearray([WELCOME])
+        for value in (player_id, self.world.width, self.world.height):
+            write_varint(welcome, value)
+        connection.send(bytes(welcome))
+
+        try:
+            while True:
+                payload = await read_frame(reader, MAX_CLIENT_FRAME)
+                if payload[:1] == bytes([INPUT]) and len(payload) == 2 and payload[1] < len(world.DIRECTION_NAMES):
+                    if len(connection.inputs) < MAX_PENDING_INPUTS:
+                        connection.inputs.append(world.DIRECTION_NAMES[payload[1]])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self.connections[player_id]
+            self.handlers.discard(asyncio.current_task())
+            self.world.leave(player_id)
+            writer.close()
+
+    def head_state(self):
+        return {player.id: (player.head[0], player.head[1], DRAWING if player.drawing else 0) for player in self.world.players.values()}
+
+    def snapshot(self):
+        return encode_state(SNAPSHOT, self.world.tick, self.world.territory.grid.nonzero(), self.world.trails.grid.nonzero(), self.head_state(), [])
+
+    def changes(self, pending, grid):
+        if not pending:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.uint16)
+        flat = np.unique(np.concatenate(pending))
+        pending.clear()
+        return flat, grid.take(flat)
+
+    def delta(self):
+        heads = self.head_state()
+        moved = {player_id: head for player_id, head in heads.items() if self.heads.get(player_id) != head}
+        gone = [player_id for player_id in self.heads if player_id not in heads]
+        self.heads = heads
+        return encode_state(DELTA, self.world.tick, self.changes(self.changed_cells, self.world.territory.grid),
+                            self.changes(self.changed_trails, self.world.trails.grid), moved, gone)
+
+    def step(self):
+        # Inputs are applied in the order each client sent them, like the local game does
+        for connection in self.connections.values():
+            player = self.world.players.get(connection.player_id)
+            if player is not None:
+                for direction in connection.inputs:
+                    player.steer(direction)
+            connection.inputs.clear()
+
+        self.world.step()
+        self.broadcast()
+
+        if self.orphans and self.world.tick >= self.orphans_until:
+            for player_id in self.orphans:
+                self.world.leave(player_id)
+            self.orphans = []
+        if self.save_path and self.save_every and self.world.tick % self.save_every == 0:
+            snapshot.save(self.world, self.save_path)
+
+    def broadcast(self):
+        delta = self.delta()
+        snapshot = None
+        self.sent[self.world.tick] = time.perf_counter()
+        self.sent.pop(self.world.tick - SENT_HISTORY, None)
+        for connection in self.connections.values():
+            if connection.behind:
+                connection.needs_snapshot = True
+            elif connection.needs_snapshot:
+                # Snapshots are only built when somebody needs one, and then shared
+                snapshot = snapshot or self.snapshot()
+                connection.send(snapshot)
+                connection.needs_snapshot = False
+            else:
+                connection.send(delta)
+
+    async def run(self, ticks=None):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while ticks is None or ticks > 0:
+            next_tick += self.tick_ms / 1000
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            if loop.time() - next_tick > self.tick_ms / 1000:
+                # Fell more than a tick behind, don't try to catch up in a burst
+                next_tick = loop.time()
+            self.step()
+            if ticks is not None:
+                ticks -= 1
+
+    async def close(self):
+        # Saved first, while everybody is still in the match for another server to carry on
+        if self.save_path:
+            snapshot.save(self.world, self.save_path)
+
+        # Closing a connection ends its handler, wait for them all so nothing is left running
+        for connection in list(self.connections.values()):
+            connection.writer.close()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+class Client:
+    """Keeps a copy of the server's board from its snapshots and deltas."""
+
+    def __init__(self):
+        self.player_id = None
+        self.territory = None
+        self.trails = None
+        self.heads = {}
+        self.tick = None
+        self.reader = self.writer = None
+
+        self.received_bytes = 0
+        self.snapshots = 0
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        kind = await self.receive()
+        if kind != WELCOME:
+            raise ConnectionError("Server didn't say hello")
+
+    def steer(self, direction):
+        self.writer.write(frame(bytes([INPUT, world.DIRECTION_NAMES.index(direction)])))
+
+    async def receive(self):
+        """Reads and applies one message from the server, and returns its kind."""
+        payload = await read_frame(self.reader)
+        self.received_bytes += FRAME.size + len(payload)
+        kind = payload[0]
+
+        if kind == WELCOME:
+            self.player_id, offset = read_varint(payload, 1)
+            width, offset = read_varint(payload, offset)
+            height, offset = read_varint(payload, offset)
+            self.territory = Territory(width, height)
+            self.trails = chunks.ChunkedGrid(width, height)
+        elif kind in (SNAPSHOT, DELTA):
+            self.apply(kind, payload)
+        return kind
+
+    def apply(self, kind, payload):
+        if kind == SNAPSHOT:
+            self.territory.clear()
+            self.trails.clear()
+            self.heads = {}
+            self.snapshots += 1
+
+        self.tick, offset = read_varint(payload, 1)
+        runs, offset = read_cells(payload, offset)
+        for owner, flat in runs_by_value(runs).items():
+            self.territory.assign(flat, owner)
+        runs, offset = read_cells(payload, offset)
+        for owner, flat in runs_by_value(runs).items():
+            self.trails.put(flat, owner)
+
+        count, offset = read_varint(payload, offset)
+        for _ in range(count):
+            values = []
+            for _ in range(4):
+                value, offset = read_varint(payload, offset)
+                values.append(value)
+            self.heads[values[0]] = tuple(values[1:])
+        count, offset = read_varint(payload, offset)
+        for _ in range(count):
+            player_id, offset = read_varint(payload, offset)
+            self.heads.pop(player_id, None)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+
+async def loopback(args):
+    """Runs a server with local clients steering at random, then checks every client ended up with the server's board."""
+    match = world.World(args.size, args.size, seed=args.seed)
+    server = Server(match, args.tick_ms)
+    port = await server.start()
+
+    clients = [Client() for _ in range(args.clients)]
+    for client in clients:
+        await client.connect("127.0.0.1", port)
+
+    latencies = []
+    stop = asyncio.Event()
+
+    async def play(client, seed):
+        steering = random.Random(seed)
+        while not stop.is_set():
+            if steering.random() < 0.3:
+                client.steer(steering.choice(world.DIRECTION_NAMES))
+            kind = await client.receive()
+            if kind == DELTA:
+                latencies.append(time.perf_counter() - server.sent[client.tick])
+
+    players = [asyncio.create_task(play(client, args.seed + i)) for i, client in enumerate(clients)]
+    await server.run(args.ticks)
+
+    # Let the last tick arrive, then stop the clients
+    while any(client.tick != match.tick for client in clients):
+        await asyncio.sleep(0.01)
+    stop.set()
+    for task in players:
+        task.cancel()
+    await asyncio.gather(*players, return_exceptions=True)
+
+    board = match.territory.read(0, 0, match.width, match.height)
+    trails = match.trails.read(0, 0, match.width, match.height)
+    in_sync = all((client.territory.read(0, 0, match.width, match.height) == board).all()
+                  and (client.trails.read(0, 0, match.width, match.height) == trails).all()
+                  and client.heads == server.heads for client in clients)
+
+    for client in clients:
+        client.close()
+    await server.close()
+
+    ms = np.array(latencies) * 1000
+    return {
+        "clients": len(clients),
+        "ticks": match.tick,
+        "in_sync": in_sync,
+        "bytes_per_client_per_tick": sum(client.received_bytes for client in clients) / len(clients) / match.tick,
+        "snapshots_sent": sum(client.snapshots for client in clients),
+        "latency_p50_ms": float(np.percentile(ms, 50)) if len(ms) else None,
+        "latency_p99_ms": float(np.percentile(ms, 99)) if len(ms) else None,
+    }
+
+
+async def serve(args):
+    if args.load:
+        match = snapshot.load(args.load)
+        print(f"Carrying on {args.load} from tick {match.tick}")
+    else:
+        match = world.World(args.size, args.size, seed=args.seed)
+    server = Server(match, args.tick_ms, save_path=args.save, save_every=args.save_every)
+    port = await server.start(args.host, args.port)
+    print(f"Serving a {match.width}x{match.height} board on {args.host}:{port}")
+    try:
+        await server.run()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an authoritative Paper-io server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--size", type=int, default=100, help="board size in cells")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--tick-ms", type=int, default=140)
+    parser.add_argument("--clients", type=int, default=0, help="run with this many loopback clients instead of serving")
+    parser.add_argument("--ticks", type=int, default=300, help="ticks to run for with loopback clients")
+    parser.add_argument("--save", help="save the match to this file every --save-every ticks and on shutdown")
+    parser.add_argument("--save-every", type=int, default=100)
+    parser.add_argument("--load", help="carry on the match saved in this file instead of starting a new one")
+    args = parser.parse_args(argv)
+
+    if args.clients:
+        if args.seed is None:
+            args.seed = 0
+        for key, value in asyncio.run(loopback(args)).items():
+            print(f"{key}: {value}")
+    else:
+        asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import argparse
+import itertools
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import bots
+import world
+
+# Runs lots of whole matches with no window, one per process at a time on every core, for tuning the game and ranking
+# bot strategies. Every match is set up from its number alone (seed, board, players), so the same command always plays
+# out the same matches and a run that was stopped can carry on where it left off:
+#   python simulate.py results.jsonl --matches 1000 --size 40 80 --strategies loops random
+# Each finished match is one line of JSON in the results file, in whatever order they finish.
+
+
+def match_configs(args):
+    """Every match the arguments ask for, in order. Each board size, player count and tick length is played
+    args.matches times."""
+    configs = []
+    for size, players, time_delay in itertools.product(args.size, args.players, args.time_delay):
+        for _ in range(args.matches):
+            index = len(configs)
+            configs.append({
+                "match": index,
+                "seed": args.seed * 1000003 + index,
+                "size": size,
+                "players": players,
+                "time_delay": time_delay,
+                # A match lasts the same time on the clock whatever the tick length, unless ticks are given
+                "ticks": args.ticks or args.seconds * 1000 // time_delay,
+                # Player i + 1 plays strategies[i % len(strategies)]
+                "strategies": args.strategies,
+                "sample_every": args.sample_every,
+            })
+    return configs
+
+
+def play(config):
+    """Plays one match to the end and returns how it went."""
+    started = time.perf_counter()
+    match = world.World(config["size"], config["size"], seed=config["seed"])
+    strategies = config["strategies"]
+    player_ids = list(range(1, config["players"] + 1))
+    strategy_of = {player_id: strategies[(player_id - 1) % len(strategies)] for player_id in player_ids}
+    for player_id in player_ids:
+        match.join(player_id)
+
+    teams = []
+    for i, name in enumerate(strategies):
+        ids = [player_id for player_id in player_ids if strategy_of[player_id] == name]
+        if ids:
+            teams.append(bots.STRATEGIES[name](match, ids, seed=config["seed"] * len(strategies) + i))
+
+    deaths = dict.fromkeys(player_ids, 0)
+    kills = dict.fromkeys(player_ids, 0)
+    curve = []
+    for tick in range(config["ticks"]):
+        if tick % config["sample_every"] == 0:
+            curve.append([match.territory.count(player_id) for player_id in player_ids])
+
+        inputs = {}
+        for team in teams:
+            inputs.update(team.take())
+        match.step(inputs)
+        for team in teams:
+            team.request()
+
+        for event in match.events:
+            if event["type"] == "death":
+                deaths[event["player"]] += 1
+                if event["killer"] is not None and event["killer"] != event["player"]:
+                    kills[event["killer"]] += 1
+    curve.append([match.territory.count(player_id) for player_id in player_ids])
+
+    for team in teams:
+        team.close()
+    duration = time.perf_counter() - started
+
+    total = match.width * match.height
+    standings = [
+        {"player": player_id, "strategy": strategy_of[player_id], "cells": match.territory.count(player_id),
+         "percent": 100 * match.territory.count(player_id) / total, "kills": kills[player_id], "deaths": deaths[player_id]}
+        for player_id in player_ids
+    ]
+    standings.sort(key=lambda entry: (-entry["cells"], entry["player"]))
+    return {
+        "match": config["match"],
+        "config": config,
+        "winner": standings[0],
+        "standings": standings,
+        "territory": curve,
+        "ticks": match.tick,
+        "game_seconds": match.tick * config["time_delay"] / 1000,
+        "duration": duration,
+        "ticks_per_second": match.tick / duration if duration else None,
+    }
+
+
+def load_results(path):
+    """Returns the results already in the file. A line cut off by the last run being stopped is removed."""
+    if not os.path.exists(path):
+        return []
+
+    results = []
+    good = 0
+    with open(path, "rb") as file:
+        for line in file:
+            try:
+                results.append(json.loads(line))
+            except ValueError:
+                break
+            good += len(line)
+    if good != os.path.getsize(path):
+        print(f"Dropping an unfinished line at the end of {path}")
+        with open(path, "r+b") as file:
+            file.truncate(good)
+    return results
+
+
+def ignore_interrupts():
+    # Ctrl+C is dealt with by the main process, the workers just get stopped
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def summary(results):
+    """Per strategy: matches won, average share of the board at the end, kills and deaths per match."""
+    table = {}
+    for result in results:
+        seen = set()
+        for entry in result["standings"]:
+            row = table.setdefault(entry["strategy"], {"matches": 0, "wins": 0, "percent": 0, "kills": 0, "deaths": 0, "players": 0})
+            if entry["strategy"] not in seen:
+                row["matches"] += 1
+                seen.add(entry["strategy"])
+            row["players"] += 1
+            row["percent"] += entry["percent"]
+            row["kills"] += entry["kills"]
+            row["deaths"] += entry["deaths"]
+        table[result["winner"]["strategy"]]["wins"] += 1
+
+    lines = []
+    for name, row in sorted(table.items(), key=lambda item: -item[1]["wins"]):
+        lines.append(f"{name}: won {row['wins']} of {row['matches']}, {row['percent'] / row['players']:.1f}% of the board on average, "
+                     f"{row['kills'] / row['players']:.2f} kills and {row['deaths'] / row['players']:.2f} deaths a player")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play lots of seeded Paper-io matches between bots, on every core.")
+    parser.add_argument("output", help="results file, one line of JSON per match. Matches already in it are skipped")
+    parser.add_argument("--matches", type=int, default=100, help="matches per combination of the settings below")
+    parser.add_argument("--size", type=int, nargs="+", default=[40], help="board sizes in cells")
+    parser.add_argument("--players", type=int, nargs="+", default=[8], help="players per match")
+    parser.add_argument("--time-delay", type=int, nargs="+", default=[140], help="milliseconds per tick, as in game.Game")
+    parser.add_argument("--seconds", type=int, default=120, help="how long a match lasts on the clock")
+    parser.add_argument("--ticks", type=int, default=None, help="ticks per match, instead of --seconds")
+    parser.add_argument("--strategies", nargs="+", default=["loops"], choices=list(bots.STRATEGIES))
+    parser.add_argument("--sample-every", type=int, default=10, help="ticks between points on the territory curves")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes to play matches in")
+    args = parser.parse_args(argv)
+
+    configs = match_configs(args)
+    results = load_results(args.output)
+    done = set()
+    for result in results:
+        index = result["match"]
+        if index >= len(configs) or result["config"] != configs[index]:
+            parser.error(f"{args.output} has match {index} played with other settings, use another file")
+        done.add(index)
+
+    todo = [config for config in configs if config["match"] not in done]
+    if done:
+        print(f"{len(done)} of {len(configs)} matches already played")
+
+    started = time.perf_counter()
+    ticks = 0
+    pool = ProcessPoolExecutor(args.workers, initializer=ignore_interrupts)
+    try:
+        with open(args.output, "a") as file:
+            futures = [pool.submit(play, config) for config in todo]
+            for finished, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                # Written and flushed one at a time, so a stopped run loses at most the matches still being played
+                file.write(json.dumps(result) + "\n")
+                file.flush()
+                results.append(result)
+                ticks += result["ticks"]
+                if finished % max(1, len(todo) // 20) == 0 or finished == len(todo):
+                    elapsed = time.perf_counter() - started
+                    print(f"{finished}/{len(todo)} matches, {ticks / elapsed:.0f} ticks/s")
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        print(f"Stopped, {len(results)} of {len(configs)} matches are in {args.output}. Run the same command again to carry on.")
+        return 1
+    pool.shutdown()
+
+    for line in summary(results):
+        print(line)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import io
+import os
+import struct
+from collections import deque
+
+import numpy as np
+
+import capture
+import world
+
+# The whole state of a world at the end of a tick, for quick saves, crash recovery and moving a match to another
+# server. Unlike a replay (see replay.py) nothing has to be played back, so loading is as quick as reading the file.
+#
+# A header and a table of sections, then the sections, each one a plain array starting on a 64 byte boundary so it can
+# be used straight out of a memory-mapped file:
+#   territory_keys, territory    the used chunks of the owner grid, as (chunk x, chunk y) and CHUNK_SIZE^2 uint16s each
+#   trail_keys, trails           the same for the trail grid
+#   stacked                      (x, y, owner) for every extra trail on a cell, see TrailIndex
+#   players                      one PLAYER record per living player
+#   bodies                       every player's body, newest cell first, one after the other in the order of players
+#   roster                       the player ids that come back when they die
+#   random                       the state of world.random: 625 words, then gauss_next in the gauss section
+
+MAGIC = b"PIOS"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBxIIQqI")  # magic, version, capture engine, seeded, width, height, tick, seed, chunk size
+SECTION = struct.Struct("<QQ")  # offset, length in bytes
+ALIGN = 64
+
+PLAYER = np.dtype([("id", "<u2"), ("direction", "i1"), ("input_direction", "i1"), ("drawing", "u1"),
+                   ("x", "<i4"), ("y", "<i4"), ("body", "<u4")])
+
+ENGINE_NAMES = list(capture.ENGINES)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def sections(chunk_size):
+    # Name, dtype and the shape of one row of every section, in the order they are in the file
+    return [
+        ("territory_keys", np.int32, (2,)),
+        ("territory", np.uint16, (chunk_size, chunk_size)),
+        ("trail_keys", np.int32, (2,)),
+        ("trails", np.uint16, (chunk_size, chunk_size)),
+        ("stacked", np.int32, (3,)),
+        ("players", PLAYER, ()),
+        ("bodies", np.int32, (2,)),
+        ("roster", np.uint16, ()),
+        ("random", np.uint32, ()),
+        ("gauss", np.float64, ()),
+    ]
+
+
+def grid_arrays(grid):
+    # Only chunks with something in them are kept
+    keys = [key for key in sorted(grid.chunks) if grid.chunks[key].any()]
+    size = grid.chunk_size
+    chunks = np.stack([grid.chunks[key] for key in keys]) if keys else np.zeros((0, size, size), dtype=np.uint16)
+    return np.array(keys, dtype=np.int32).reshape(-1, 2), chunks
+
+
+def write(match, file):
+    """Writes the world to an open binary file."""
+    players = list(match.players.values())
+    records = np.zeros(len(players), dtype=PLAYER)
+    for record, player in zip(records, players):
+        record["id"] = player.id
+        record["direction"] = world.DIRECTION_NAMES.index(player.direction) if player.direction else -1
+        record["input_direction"] = world.DIRECTION_NAMES.index(player.input_direction) if player.input_direction else -1
+        record["drawing"] = player.drawing
+        record["x"], record["y"] = player.head
+        record["body"] = len(player.body)
+
+    version, state, gauss = match.random.getstate()
+    arrays = {
+        "stacked": np.array([(x, y, owner) for (x, y), owners in match.trails.stacked.items() for owner in owners], dtype=np.int32).reshape(-1, 3),
+        "players": records,
+        "bodies": np.array([cell for player in players for cell in player.body], dtype=np.int32).reshape(-1, 2),
+        "roster": np.array(match.roster, dtype=np.uint16),
+        "random": np.array(state, dtype=np.uint32),
+        "gauss": np.array([np.nan if gauss is None else gauss]),
+    }
+    arrays["territory_keys"], arrays["territory"] = grid_arrays(match.territory.grid)
+    arrays["trail_keys"], arrays["trails"] = grid_arrays(match.trails.grid)
+
+    engine = ENGINE_NAMES.index(capture.engine_name(match.capture_engine))
+    seeded = match.seed is not None
+    file.write(HEADER.pack(MAGIC, VERSION, engine, seeded, match.width, match.height, match.tick, match.seed if seeded else 0,
+                           match.territory.grid.chunk_size))
+
+    # The table, then every section padded out to the next boundary
+    names = [name for name, dtype, shape in sections(match.territory.grid.chunk_size)]
+    offset = HEADER.size + SECTION.size * len(names)
+    table = []
+    for name in names:
+        offset += -offset % ALIGN
+        table.append(SECTION.pack(offset, arrays[name].nbytes))
+        offset += arrays[name].nbytes
+    file.write(b"".join(table))
+
+    offset = HEADER.size + SECTION.size * len(names)
+    for name in names:
+        file.write(bytes(-offset % ALIGN))
+        offset += -offset % ALIGN
+        file.write(np.ascontiguousarray(arrays[name]).data)
+        offset += arrays[name].nbytes
+
+
+def to_bytes(match):
+    out = io.BytesIO()
+    write(match, out)
+    return out.getvalue()
+
+
+def save(match, path):
+    # Written next to the old file and swapped in, so a crash while saving never leaves a broken snapshot behind
+    with open(path + ".tmp", "wb") as file:
+        write(match, file)
+    os.replace(path + ".tmp", path)
+
+
+class Snapshot:
+    """A snapshot read from a file or bytes. The arrays are used where they are, so with use_mmap the file is only
+    read as they are touched, and a loaded board costs no copy. Writes to them never go back to the file, but they do
+    show up in any other world restored from the same Snapshot, so only restore one into one world."""
+
+    def __init__(self, data, use_mmap=False):
+        if isinstance(data, str):
+            data = np.memmap(data, dtype=np.uint8, mode="c") if use_mmap else np.fromfile(data, dtype=np.uint8)
+        else:
+            data = np.frombuffer(bytearray(data), dtype=np.uint8)
+
+        if len(data) < HEADER.size:
+            raise SnapshotError("Not a snapshot")
+        magic, version, engine, seeded, self.width, self.height, self.tick, seed, chunk_size = HEADER.unpack(data[:HEADER.size].tobytes())
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError("Not a snapshot this version can load")
+        self.capture_engine = ENGINE_NAMES[engine]
+        self.seed = seed if seeded else None
+        self.chunk_size = chunk_size
+
+        self.arrays = {}
+        offset = HEADER.size
+        for name, dtype, shape in sections(chunk_size):
+            start, length = SECTION.unpack(data[offset:offset + SECTION.size].tobytes())
+            offset += SECTION.size
+            if start + length > len(data):
+                raise SnapshotError("Snapshot is cut short")
+            self.arrays[name] = data[start:start + length].view(dtype).reshape((-1,) + shape)
+        self.roster = self.arrays["roster"].tolist()
+
+    def world(self):
+        """Returns a new world in this state."""
+        match = world.World(self.width, self.height, self.seed, self.capture_engine)
+        self.restore(match)
+        return match
+
+    def restore(self, match):
+        """Puts an existing world of the same size into this state. Its listeners hear about every cell that changes."""
+        if (match.width, match.height) != (self.width, self.height) or match.territory.grid.chunk_size != self.chunk_size:
+            raise SnapshotError(f"Snapshot is of a {self.width}x{self.height} board, not {match.width}x{match.height}")
+        arrays = self.arrays
+
+        match.territory.load(dict(zip(map(tuple, arrays["territory_keys"].tolist()), arrays["territory"])))
+        stacked = {}
+        for x, y, owner in arrays["stacked"].tolist():
+            stacked.setdefault((x, y), []).append(owner)
+        match.trails.load(dict(zip(map(tuple, arrays["trail_keys"].tolist()), arrays["trails"])), stacked)
+
+        match.players = {}
+        bodies = arrays["bodies"].tolist()
+        start = 0
+        for player_id, direction, input_direction, drawing, x, y, length in arrays["players"].tolist():
+            player = world.Player(player_id, (x, y))
+            player.direction = world.DIRECTION_NAMES[direction] if direction >= 0 else None
+            player.input_direction = world.DIRECTION_NAMES[input_direction] if input_direction >= 0 else None
+            player.drawing = bool(drawing)
+            player.body = deque(map(tuple, bodies[start:start + length]))
+            start += length
+            match.players[player.id] = player
+
+        match.roster = list(self.roster)
+        match.respawns = deque(player_id for player_id in match.roster if player_id not in match.players)
+        match.tick = self.tick
+        match.seed = self.seed
+        match.capture_engine = capture.ENGINES[self.capture_engine]
+        match.dead = []
+        match.events = []
+        gauss = float(arrays["gauss"][0])
+        match.random.setstate((3, tuple(arrays["random"].tolist()), None if np.isnan(gauss) else gauss))
+
+
+def load(data, use_mmap=False):
+    """Returns a new world from a snapshot file (by path) or bytes."""
+    return Snapshot(data, use_mmap).world()
@@ -0,0 +1,139 @@
+import itertools
+
+import numpy as np
+
+# Where players spawn. The board is split into SPAWN_BLOCK x SPAWN_BLOCK blocks and the index keeps track of which ones
+# have nobody's territory or trail in them. It follows the board through the territory and trail listeners and only
+# looks at the blocks that changed, so finding a spot never means searching the board.
+#
+# A spot is the middle of a free block. A free block whose neighbours are all free as well is better, and of a few of
+# those the one furthest from anybody's head wins. The choice only depends on the board and the world's random numbers,
+# so replays and loaded snapshots spawn players in the same places.
+SPAWN_BLOCK = 4
+
+# Random blocks tried before every block is looked at instead. Guessing is only worth it while at least 1 in
+# GUESS_FRACTION blocks is clear.
+SAMPLES = 32
+GUESS_FRACTION = 4
+
+# Spots compared on how far they are from the nearest head
+CANDIDATES = 4
+
+# Changed cells collected before they are worked through anyway, so a long stretch without spawns doesn't pile them up
+MAX_PENDING = 4096
+
+
+class SpawnIndex:
+    def __init__(self, match):
+        self.world = match
+
+        # Cells past the last whole block (when the board isn't a multiple of SPAWN_BLOCK) are never spawned in
+        self.columns = match.width // SPAWN_BLOCK
+        self.rows = match.height // SPAWN_BLOCK
+
+        # Indexed [row, column]. Clear blocks are free ones with only free blocks (or the edge) around them. free is a
+        # view into a grid with a border of free blocks, so the blocks around any block can be sliced out.
+        self.padded = np.ones((self.rows + 2, self.columns + 2), dtype=bool)
+        self.free = self.padded[1:-1, 1:-1]
+        self.clear = np.ones((self.rows, self.columns), dtype=bool)
+        self.clear_count = self.clear.size
+
+        # Blocks never straddle two chunks of the grids, so changes are worked through a chunk at a time
+        self.chunk_size = match.territory.grid.chunk_size
+        self.chunk_blocks = self.chunk_size // SPAWN_BLOCK
+        self.chunk_columns = match.territory.grid.columns
+
+        # Flat cells changed since the last update. The trails send lists of a cell or two at a time, which are
+        # quicker to keep as one list than to turn into arrays one by one.
+        self.pending = []
+        self.pending_cells = []
+        self.pending_count = 0
+        match.territory.listeners.append(self.changed)
+        match.trails.listeners.append(self.changed)
+
+    def changed(self, flat):
+        if isinstance(flat, list):
+            self.pending_cells += flat
+        else:
+            self.pending.append(flat)
+        self.pending_count += len(flat)
+        if self.pending_count > MAX_PENDING:
+            self.update()
+
+    def update(self):
+        """Recounts the blocks of every chunk with a changed cell in it."""
+        if not self.pending_count:
+            return
+        flat = np.concatenate(self.pending + [np.array(self.pending_cells, dtype=np.intp)]).astype(np.intp)
+        self.pending = []
+        self.pending_cells = []
+        self.pending_count = 0
+
+        width = self.world.width
+        keys = flat // width // self.chunk_size * self.chunk_columns + flat % width // self.chunk_size
+        for key in np.flatnonzero(np.bincount(keys)).tolist():
+            self.update_chunk(*divmod(key, self.chunk_columns)[::-1])
+
+    def update_chunk(self, cx, cy):
+        per = self.chunk_blocks
+        row0, column0 = cy * per, cx * per
+        row1, column1 = min(row0 + per, self.rows), min(column0 + per, self.columns)
+        if row0 >= row1 or column0 >= column1:
+            return
+
+        used = np.zeros((per, per), dtype=bool)
+        for grid in (self.world.territory.grid, self.world.trails.grid):
+            chunk = grid.chunks.get((cx, cy))
+            if chunk is not None:
+                # Rows of blocks first, then columns, which is a lot quicker than both axes at once
+                used |= chunk.reshape(per, SPAWN_BLOCK, -1).any(axis=1).reshape(per, per, SPAWN_BLOCK).any(axis=2)
+        self.free[row0:row1, column0:column1] = ~used[:row1 - row0, :column1 - column0]
+
+        # Clearness changes for these blocks and the ones just around them
+        row0, column0 = max(row0 - 1, 0), max(column0 - 1, 0)
+        row1, column1 = min(row1 + 1, self.rows), min(column1 + 1, self.columns)
+        window = self.padded[row0:row1 + 2, column0:column1 + 2]
+        clear = np.ones((row1 - row0, column1 - column0), dtype=bool)
+        for dy in (0, 1, 2):
+            for dx in (0, 1, 2):
+                clear &= window[dy:dy + row1 - row0, dx:dx + column1 - column0]
+        self.clear_count += int(np.count_nonzero(clear)) - int(np.count_nonzero(self.clear[row0:row1, column0:column1]))
+        self.clear[row0:row1, column0:column1] = clear
+
+    def find(self):
+        """Returns the cell a new player should be spawned on."""
+        if not self.rows or not self.columns:
+            return self.world.random_cell()
+        self.update()
+        random = self.world.random
+
+        # Usually a few guesses find clear blocks
+        candidates = []
+        if self.clear_count * GUESS_FRACTION >= self.clear.size:
+            clear = self.clear.ravel()
+            for _ in range(SAMPLES):
+                block = random.randrange(clear.size)
+                if clear[block]:
+                    candidates.append(divmod(block, self.columns))
+                    if len(candidates) == CANDIDATES:
+                        break
+
+        # On a crowded board, pick from all the clear blocks, or failing that the free ones
+        if not candidates:
+            for blocks in (self.clear, self.free):
+                blocks = np.flatnonzero(blocks)
+                if blocks.size:
+                    candidates = [divmod(int(blocks[random.randrange(blocks.size)]), self.columns) for _ in range(CANDIDATES)]
+                    break
+
+        # Nowhere free at all, so somebody gets painted over
+        if not candidates:
+            return self.world.random_cell()
+
+        cells = np.array([(column * SPAWN_BLOCK + SPAWN_BLOCK // 2, row * SPAWN_BLOCK + SPAWN_BLOCK // 2) for row, column in candidates])
+        if self.world.players:
+            players = self.world.players.values()
+            heads = np.fromiter(itertools.chain.from_iterable(player.head for player in players), dtype=np.intp, count=2 * len(players)).reshape(-1, 2)
+            distance = np.abs(cells[:, None, :] - heads[None, :, :]).max(axis=2).min(axis=1)
+            cells = cells[distance.argmax():]
+        return int(cells[0, 0]), int(cells[0, 1])
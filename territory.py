@@ -0,0 +1,142 @@
+import numpy as np
+
+import chunks
+
+# Ownership of the board is kept in a grid of player ids instead of a dict of cells. The grid is chunked, so a huge
+# arena only costs memory where somebody has been.
+# 0 means nobody owns the cell. uint16 leaves room for plenty of players (bots included).
+NO_OWNER = 0
+
+
+class Territory:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+        self.grid = chunks.ChunkedGrid(width, height)
+
+        # Every owner also keeps a set of the cells it owns (as y * width + x). It's updated on every write, so
+        # "how big is this player" or "which cells does it own" never has to look at the rest of the board.
+        self.owned = {}
+
+        # Called with an array of flat cell indices whenever those cells change hands, so things like the renderer
+        # can follow the board without rescanning it
+        self.listeners = []
+
+    def get(self, x, y):
+        return self.grid.get(x, y)
+
+    def owns(self, x, y, owner):
+        return self.grid.get(x, y) == owner
+
+    def read(self, x0, y0, x1, y1):
+        """Returns the owners of the box x0 <= x < x1, y0 <= y < y1 as an array indexed [y, x]."""
+        return self.grid.read(x0, y0, x1, y1)
+
+    def set(self, x, y, owner):
+        self.assign(np.array([y * self.width + x]), owner)
+
+    def fill(self, cells, owner):
+        """Gives every (x, y) cell in cells to owner in one go."""
+        cells = np.asarray(cells, dtype=np.intp).reshape(-1, 2)
+        self.assign(cells[:, 1] * self.width + cells[:, 0], owner)
+
+    def fill_rect(self, x, y, width, height, owner):
+        """Gives a rectangle of cells to owner, clipped to the board."""
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, self.width), min(y + height, self.height)
+        if x0 < x1 and y0 < y1:
+            ys, xs = np.mgrid[y0:y1, x0:x1]
+            self.assign((ys * self.width + xs).ravel(), owner)
+
+    def fill_mask(self, x, y, mask, owner):
+        """Gives owner every cell set in mask, where mask[0, 0] is the cell (x, y)."""
+        ys, xs = np.nonzero(mask)
+        self.assign((ys + y) * self.width + xs + x, owner)
+
+    def assign(self, flat, owner):
+        """Gives owner every cell in flat (an array of y * width + x indices) and keeps the owned sets up to date."""
+        previous = self.grid.take(flat)
+        changed = previous != owner
+        if not changed.any():
+            return
+
+        flat = flat[changed]
+        previous = previous[changed]
+        for old in np.unique(previous).tolist():
+            if old != NO_OWNER:
+                self.owned[old].difference_update(flat[previous == old].tolist())
+
+        self.grid.put(flat, owner)
+        if owner != NO_OWNER:
+            self.owned.setdefault(owner, set()).update(flat.tolist())
+        self.notify(flat)
+
+    def notify(self, flat):
+        for listener in self.listeners:
+            listener(flat)
+
+    def count(self, owner):
+        return len(self.owned.get(owner, ()))
+
+    def flat_cells(self, owner):
+        """Returns the cells owned by owner as an array of y * width + x indices."""
+        return np.fromiter(self.owned.get(owner, ()), dtype=np.intp)
+
+    def cells(self, owner):
+        """Returns the (x, y) cells owned by owner as an (N, 2) array."""
+        flat = self.flat_cells(owner)
+        return np.column_stack((flat % self.width, flat // self.width))
+
+    def bounds(self, owner):
+        """Returns the (x0, y0, x1, y1) box around owner's cells, x1 and y1 exclusive, or None if it owns nothing."""
+        flat = self.flat_cells(owner)
+        if not flat.size:
+            return None
+        ys, xs = flat // self.width, flat % self.width
+        return int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1
+
+    def clear_owner(self, owner):
+        return self.clear_owners([owner])[owner]
+
+    def clear_owners(self, owners):
+        """Takes every cell away from each of owners in one pass, and returns how many cells each of them lost."""
+        freed = {}
+        batches = []
+        for owner in owners:
+            cells = self.owned.pop(owner, None) or ()
+            freed[owner] = len(cells)
+            if cells:
+                batches.append(np.fromiter(cells, dtype=np.intp, count=len(cells)))
+
+        if batches:
+            flat = np.concatenate(batches)
+            self.grid.put(flat, NO_OWNER)
+            self.notify(flat)
+        return freed
+
+    def load(self, chunks):
+        """Replaces the whole board with chunks ((chunk x, chunk y) -> array, as from a snapshot) and works the owned
+        sets out again from them."""
+        self.clear()
+        self.grid.chunks = chunks
+        self.owned = {}
+
+        flat, owners = self.grid.nonzero()
+        if not flat.size:
+            return
+
+        # One set update per owner
+        order = np.argsort(owners, kind="stable")
+        sorted_flat, owners = flat[order], owners[order]
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(owners)) + 1))
+        for owner, cells in zip(owners[starts].tolist(), np.split(sorted_flat, starts[1:])):
+            self.owned[owner] = set(cells.tolist())
+        self.notify(flat)
+
+    def clear(self):
+        flat = np.concatenate([np.fromiter(cells, dtype=np.intp, count=len(cells)) for cells in self.owned.values()] or [np.zeros(0, dtype=np.intp)])
+        self.grid.clear()
+        self.owned = {}
+        if flat.size:
+            self.notify(flat)
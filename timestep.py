@@ -0,0 +1,68 @@
+import threading
+import time
+
+
+class FixedTimestep:
+    """Turns real elapsed time into a whole number of fixed length simulation ticks."""
+
+    def __init__(self, step_ms, max_steps=5):
+        self.step_ms = step_ms
+
+        # After a long stall (a slow frame, the window being dragged) only catch up this many ticks rather than
+        # running the simulation flat out to make up all of it
+        self.max_steps = max_steps
+        self.accumulator = 0
+
+    def advance(self, elapsed_ms):
+        """Adds elapsed_ms of real time and returns how many ticks are now due."""
+        self.accumulator += elapsed_ms
+        steps = int(self.accumulator // self.step_ms)
+        if steps > self.max_steps:
+            steps = self.max_steps
+            self.accumulator = 0
+        else:
+            self.accumulator -= steps * self.step_ms
+        return steps
+
+    def reset(self):
+        self.accumulator = 0
+
+    @property
+    def alpha(self):
+        """How far the simulation is through the current tick, from 0 to 1."""
+        return min(self.accumulator / self.step_ms, 1)
+
+
+class SimulationThread(threading.Thread):
+    """Calls tick every step_ms on its own thread. Anything tick changes should only be read while holding lock."""
+
+    def __init__(self, tick, step_ms, lock):
+        super().__init__(daemon=True)
+        self.tick = tick
+        self.step_ms = step_ms
+        self.lock = lock
+        self.stopped = threading.Event()
+        self.last_tick = time.perf_counter()
+
+    def run(self):
+        step = self.step_ms / 1000
+        next_tick = time.perf_counter() + step
+        while not self.stopped.is_set():
+            delay = next_tick - time.perf_counter()
+            if delay > 0 and self.stopped.wait(delay):
+                break
+
+            with self.lock:
+                self.tick()
+                self.last_tick = time.perf_counter()
+
+            # Like FixedTimestep, don't try to make up for a long stall
+            next_tick = max(next_tick + step, self.last_tick - step)
+
+    @property
+    def alpha(self):
+        return min((time.perf_counter() - self.last_tick) * 1000 / self.step_ms, 1)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
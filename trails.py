@@ -0,0 +1,80 @@
+import chunks
+from territory import NO_OWNER
+
+
+class TrailIndex:
+    """Which player's trail is on each cell, so a head can be checked against every trail with one lookup."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.grid = chunks.ChunkedGrid(width, height)
+
+        # A cell is almost always in at most one trail, but a trail can cross the one-cell body of a player sitting
+        # at home. The rare extra owners of a cell are kept here.
+        self.stacked = {}
+
+        # Called with a list of flat cell indices (y * width + x) whenever the trail on them changes
+        self.listeners = []
+
+    def notify(self, cell):
+        flat = [cell[1] * self.width + cell[0]]
+        for listener in self.listeners:
+            listener(flat)
+
+    def add(self, cell, owner):
+        x, y = cell
+        if self.grid.get(x, y) == NO_OWNER:
+            self.grid.set(x, y, owner)
+            self.notify(cell)
+        else:
+            self.stacked.setdefault(cell, []).append(owner)
+
+    def remove(self, cell, owner):
+        x, y = cell
+        extra = self.stacked.get(cell)
+        if self.grid.get(x, y) == owner:
+            self.grid.set(x, y, extra.pop() if extra else NO_OWNER)
+            self.notify(cell)
+        elif extra and owner in extra:
+            extra.remove(owner)
+
+        if extra is not None and not extra:
+            del self.stacked[cell]
+
+    def remove_trail(self, cells, owner):
+        for cell in cells:
+            self.remove(cell, owner)
+
+    def at(self, cell):
+        """Returns the ids of every trail on cell."""
+        owner = self.grid.get(*cell)
+        if owner == NO_OWNER:
+            return ()
+        extra = self.stacked.get(cell)
+        return (owner, *extra) if extra else (owner,)
+
+    def read(self, x0, y0, x1, y1):
+        """Returns the trail on each cell of the box x0 <= x < x1, y0 <= y < y1 as an array indexed [y, x]."""
+        return self.grid.read(x0, y0, x1, y1)
+
+    def clear(self):
+        # Only the cells that had a trail on them need telling about
+        flat = self.grid.nonzero()[0].tolist()
+        self.grid.clear()
+        self.stacked = {}
+        if flat:
+            for listener in self.listeners:
+                listener(flat)
+
+    def load(self, chunks, stacked):
+        """Replaces every trail with chunks ((chunk x, chunk y) -> array, as from a snapshot) and the extra owners in
+        stacked."""
+        self.clear()
+        self.grid.chunks = chunks
+        self.stacked = stacked
+        if self.listeners:
+            flat = self.grid.nonzero()[0].tolist()
+            if flat:
+                for listener in self.listeners:
+                    listener(flat)
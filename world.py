@@ -0,0 +1,219 @@
+import random
+import zlib
+from collections import deque
+
+import numpy as np
+
+import capture
+import profiling
+import spawning
+from territory import Territory
+from trails import TrailIndex
+
+# The world is the game without pygame. Everything here works in grid cells (not pixels) so it can be stepped
+# without a window, as fast as the CPU allows. game.Game and snakefile.Snake sit on top of it and only draw it.
+
+DIRECTIONS = {"left": (-1, 0), "right": (1, 0), "up": (0, -1), "down": (0, 1)}
+OPPOSITES = {"left": "right", "right": "left", "up": "down", "down": "up"}
+
+# Directions by number, for the arrays bots and envs work on and for the replay, snapshot and network formats
+DIRECTION_NAMES = list(DIRECTIONS)
+VECTORS = np.array([DIRECTIONS[name] for name in DIRECTION_NAMES])
+OPPOSITE = np.array([DIRECTION_NAMES.index(OPPOSITES[name]) for name in DIRECTION_NAMES])
+
+
+class Player:
+    def __init__(self, player_id, location):
+        self.id = player_id
+        self.head = location
+
+        # Newest cell first. A deque so the trail grows and shrinks at either end in O(1)
+        self.body = deque()
+
+        self.drawing = False
+        self.alive = True
+        self.direction = None
+        self.input_direction = None
+
+    def steer(self, direction):
+        # A snake can't turn back on itself while drawing, but it can when it is safe inside its own area
+        if direction in DIRECTIONS and (self.direction != OPPOSITES[direction] or not self.drawing):
+            self.input_direction = direction
+
+
+class World:
+    def __init__(self, width, height, seed=None, capture_engine="flood"):
+        # Size of the board in cells
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        # Who owns which cell, and how enclosed cells are worked out (see capture.py)
+        self.territory = Territory(width, height)
+        self.capture_engine = capture.ENGINES[capture_engine]
+
+        # Which trails are on which cell, kept in step with every player's body
+        self.trails = TrailIndex(width, height)
+
+        # Only living players are kept here, a dead player is removed until it is spawned again.
+        # Players in the roster are spawned again at the end of the tick they die in, from the respawn queue.
+        self.players = {}
+        self.roster = []
+        self.respawns = deque()
+        self.tick = 0
+
+        # Keeps track of the free parts of the board, so spawning doesn't land on anybody
+        self.spawns = spawning.SpawnIndex(self)
+
+        # Players killed this tick, their area is cleared all at once at the end of the tick
+        self.dead = []
+
+        # What happened during the last tick, as dicts with a "type" of "capture", "death" or "spawn"
+        self.events = []
+
+    def in_bounds(self, cell):
+        return 0 <= cell[0] < self.width and 0 <= cell[1] < self.height
+
+    def random_cell(self):
+        return self.random.randint(0, self.width - 1), self.random.randint(0, self.height - 1)
+
+    def spawn(self, player_id, location=None):
+        if location is None:
+            location = self.spawns.find()
+
+        player = Player(player_id, location)
+        self.players[player_id] = player
+
+        # Fill 9 squares around location
+        self.territory.fill_rect(location[0] - 1, location[1] - 1, 3, 3, player_id)
+
+        self.events.append({"type": "spawn", "player": player_id})
+        return player
+
+    def join(self, player_id, location=None):
+        """Spawns a player that keeps coming back whenever it dies."""
+        self.roster.append(player_id)
+        return self.spawn(player_id, location)
+
+    def respawn(self):
+        # Players that left, or were brought back some other way, since they were queued are skipped
+        while self.respawns:
+            player_id = self.respawns.popleft()
+            if player_id in self.roster and player_id not in self.players:
+                self.spawn(player_id)
+
+    def leave(self, player_id):
+        """Takes a player out of the roster for good. Its area is cleared at the end of the next tick."""
+        if player_id in self.roster:
+            self.roster.remove(player_id)
+        if player_id in self.players:
+            self.kill(self.players[player_id])
+
+    def kill(self, player, killer=None):
+        self.trails.remove_trail(player.body, player.id)
+        player.body = deque()
+        player.alive = False
+        self.players.pop(player.id, None)
+        self.dead.append((player.id, killer))
+        if player.id in self.roster:
+            self.respawns.append(player.id)
+
+    def clear_dead(self):
+        """Clears the area of everyone killed since the last call, in one go."""
+        if not self.dead:
+            return
+
+        freed = self.territory.clear_owners([player_id for player_id, killer in self.dead])
+        for player_id, killer in self.dead:
+            self.events.append({"type": "death", "player": player_id, "killer": killer, "cells": freed[player_id]})
+        self.dead = []
+
+    def leaderboard(self):
+        """Returns the living players and anyone still owning cells, ranked by the number of cells they own."""
+        total = self.width * self.height
+        player_ids = set(self.players).union(self.territory.owned)
+
+        board = []
+        for player_id in player_ids:
+            cells = self.territory.count(player_id)
+            if cells or player_id in self.players:
+                board.append({"player": player_id, "cells": cells, "percent": 100 * cells / total})
+
+        board.sort(key=lambda entry: (-entry["cells"], entry["player"]))
+        return board
+
+    def step(self, inputs=None):
+        """Advances the world by one tick. inputs maps a player id to the direction it wants to turn."""
+        self.events = []
+        if inputs:
+            for player_id, direction in inputs.items():
+                if player_id in self.players:
+                    self.players[player_id].steer(direction)
+
+        for player in list(self.players.values()):
+            # A player may have been killed earlier in this tick
+            if player.alive and (player.direction or player.input_direction):
+                self.advance(player)
+
+        self.clear_dead()
+        self.respawn()
+        self.tick += 1
+
+    def state_hash(self):
+        """Returns a checksum of everything that decides how the match plays out from here."""
+        checksum = zlib.crc32(self.territory.grid.tobytes())
+        checksum = zlib.crc32(self.trails.grid.tobytes(), checksum)
+        players = [(p.id, p.head, p.direction, p.input_direction, p.drawing, list(p.body)) for p in self.players.values()]
+        checksum = zlib.crc32(repr((self.tick, players, self.random.getstate())).encode(), checksum)
+        return checksum
+
+    def advance(self, player):
+        if player.direction:
+            # Extend body, if not drawing this will be removed later
+            player.body.appendleft(player.head)
+            self.trails.add(player.head, player.id)
+
+            # When not drawing the body is reduced to a max length of 1
+            if not player.drawing and len(player.body) > 1:
+                self.trails.remove(player.body.pop(), player.id)
+
+            # Move snake forward, stay put if it hits a wall
+            dx, dy = DIRECTIONS[player.direction]
+            head = (player.head[0] + dx, player.head[1] + dy)
+            if self.in_bounds(head):
+                player.head = head
+            else:
+                self.trails.remove(player.body.popleft(), player.id)
+
+        # Direction is stored as input direction until after the next move has occurred.
+        # This stops the square moving in the preferred direction before the display has reached the next square
+        player.direction = player.input_direction
+
+        # Calc drawing value and filling area when drawing becomes False
+        if self.territory.owns(*player.head, player.id):
+            if player.drawing:
+                self.capture(player)
+        else:
+            player.drawing = True
+
+        # Check death cases, running into a trail kills whoever it belongs to
+        with profiling.profiler.span("collision"):
+            trail_owners = self.trails.at(player.head)
+            for owner in trail_owners:
+                other = self.players.get(owner)
+                if other is not None and other is not player and other.drawing:
+                    self.kill(other, player.id)
+            if player.id in trail_owners:
+                self.kill(player, player.id)
+
+    def capture(self, player):
+        before = self.territory.count(player.id)
+        with profiling.profiler.span("capture"):
+            self.capture_engine(self.territory, player.id, player.body, player.head)
+        self.events.append({"type": "capture", "player": player.id, "cells": self.territory.count(player.id) - before})
+
+        # Clear the body and drawing value
+        self.trails.remove_trail(player.body, player.id)
+        player.body = deque()
+        player.drawing = False